@@ -121,7 +121,16 @@ def argparser():
 
     # off-policy rl
     parser.add_argument(
-        "--buffer_size", type=int, default=int(1e6), help="the size of the buffer"
+        "--buffer_size",
+        type=int,
+        default=int(1e6),
+        help="the number of transitions the buffer holds",
+    )
+    parser.add_argument(
+        "--quantize_ob",
+        type=str2bool,
+        default=False,
+        help="store observations in the buffer as uint8",
     )
     parser.add_argument(
         "--discount_factor", type=float, default=0.99, help="the discount factor"
@@ -159,6 +168,44 @@ def argparser():
         help="maximum number of time steps",
     )
     parser.add_argument("--gpu", type=int, default=None, help="gpu id")
+    parser.add_argument(
+        "--distributed",
+        type=str2bool,
+        default=False,
+        help="use torch.distributed (launched with torchrun) instead of MPI",
+    )
+    parser.add_argument(
+        "--async_rollout",
+        type=str2bool,
+        default=False,
+        help="train in the background while the next rollout is collected",
+    )
+    parser.add_argument(
+        "--use_torch_compile",
+        type=str2bool,
+        default=False,
+        help="compile the actor and critic networks with torch.compile",
+    )
+    parser.add_argument(
+        "--torch_compile_mode",
+        type=str,
+        default="default",
+        choices=["default", "max-autotune-no-cudagraphs", "reduce-overhead"],
+        help="torch.compile mode, reduce-overhead opts in to CUDA graphs",
+    )
+    parser.add_argument(
+        "--allow_tf32",
+        type=str2bool,
+        default=False,
+        help="allow TF32 tensor cores for matmul and cudnn",
+    )
+    parser.add_argument(
+        "--amp_dtype",
+        type=str,
+        default="float32",
+        choices=["float32", "bfloat16", "float16"],
+        help="autocast dtype of the critic forward pass in sac updates",
+    )
 
     # sac
     parser.add_argument(
@@ -264,12 +311,31 @@ def argparser():
         "--record", type=str2bool, default=True, help="enable video recording"
     )
     parser.add_argument("--record_caption", type=str2bool, default=True)
+    parser.add_argument(
+        "--nvenc_video",
+        type=str2bool,
+        default=False,
+        help="encode logged videos with NVENC on the gpu",
+    )
     parser.add_argument(
         "--num_record_samples",
         type=int,
         default=1,
         help="number of trajectories to collect during eval",
     )
+    parser.add_argument(
+        "--parallel_eval",
+        type=str2bool,
+        default=False,
+        help="run evaluation episodes concurrently, each on its own eval env; "
+        "not supported with mopa or record",
+    )
+    parser.add_argument(
+        "--num_eval_workers",
+        type=int,
+        default=4,
+        help="maximum number of concurrent evaluation episodes",
+    )
 
     # misc
     parser.add_argument("--prefix", type=str, default="test", help="prefix for wandb")
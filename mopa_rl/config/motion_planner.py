@@ -77,7 +77,7 @@ def get_default_config():
     import argparse
 
     parser = argparse.ArgumentParser("Default Configuration for Motion Planner")
-    add_argument(parser)
+    add_arguments(parser)
 
     config = parser.parse_args([])
     return config
@@ -1,3 +1,5 @@
+from types import SimpleNamespace
+
 from mopa_rl.util import str2bool
 
 
@@ -111,17 +113,38 @@ def add_arguments(parser):
     )
 
 
+# mirrors the defaults of add_arguments so they can be read without argparse
+DEFAULT_CONFIG = dict(
+    reward_type="dense",
+    distance_threshold=0.06,
+    max_episode_steps=250,
+    screen_width=500,
+    screen_height=500,
+    camera_name="visview",
+    frame_skip=1,
+    action_repeat=5,
+    ctrl_reward_coef=0,
+    kp=40.0,
+    kd=8.0,
+    ki=0.0,
+    frame_dt=0.15,
+    use_robot_indicator=True,
+    use_target_robot_indicator=True,
+    success_reward=150.0,
+    range=0.1,
+    simple_planner_range=0.05,
+    timelimit=1.0,
+    simple_planner_timelimit=0.05,
+    contact_threshold=-0.002,
+    joint_margin=0.001,
+    step_size=0.02,
+    seed=1234,
+    debug=False,
+)
+
+
 def get_default_config():
     """
     Gets default configurations for the Sawyer environment.
     """
-    import argparse
-
-    parser = argparse.ArgumentParser("Default Configuration for Sawyer Environment")
-    add_arguments(parser)
-
-    parser.add_argument("--seed", type=int, default=1234, help="random seed")
-    parser.add_argument("--debug", type=str2bool, default=False, help="enable debugging")
-
-    config = parser.parse_args([])
-    return config
+    return SimpleNamespace(**DEFAULT_CONFIG)
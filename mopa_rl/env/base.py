@@ -365,6 +365,7 @@ class BaseEnv(gym.Env):
 
     def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
+        self._rng = np.random.default_rng(seed)
         return [seed]
 
     def _viewer_reset(self):
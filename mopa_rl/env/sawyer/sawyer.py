@@ -7,6 +7,7 @@ except ImportError as e:
 import numpy as np
 import gym
 from gym import spaces
+from numba import njit
 
 from mopa_rl.env.base import BaseEnv
 from mopa_rl.util.logger import logger
@@ -15,6 +16,12 @@ from mopa_rl.util.transform_utils import *
 np.set_printoptions(suppress=True)
 
 
+@njit(cache=True)
+def _apply_gravity_comp(qfrc_applied, qfrc_bias, idx):
+    for k in range(idx.shape[0]):
+        qfrc_applied[idx[k]] = qfrc_bias[idx[k]]
+
+
 class SawyerEnv(BaseEnv):
     def __init__(self, xml_path, **kwargs):
         super().__init__(xml_path, **kwargs)
@@ -24,6 +31,9 @@ class SawyerEnv(BaseEnv):
         minimum = -np.ones(self.dof)
         maximum = np.ones(self.dof)
         self._ac_scale = 0.05
+        self._ac_lo = np.full(self.robot_dof, -self._ac_scale)
+        self._ac_hi = np.full(self.robot_dof, self._ac_scale)
+        self._clip_out = np.empty(self.robot_dof)
 
         self._minimum = minimum
         self._maximum = maximum
@@ -44,9 +54,17 @@ class SawyerEnv(BaseEnv):
         self.use_robot_indicator = kwargs["use_robot_indicator"]
         self.use_target_robot_indicator = kwargs["use_target_robot_indicator"]
         self._is_jnt_limited = is_jnt_limited
+        self._reward_type = kwargs["reward_type"]
+        self._n_inner_loop = int(self._frame_dt / self.dt)
 
         self._prev_state = None
+        # _prev_state points at this buffer once set; None still marks a reset
+        self._prev_state_buf = np.empty(self.robot_dof)
         self._i_term = None
+        # index permutation of convert_quat(q, to="xyzw") for MuJoCo quaternions
+        self._wxyz2xyzw = np.array([1, 2, 3, 0])
+        # arm joint targets followed by gripper joint targets, reused every step
+        self._converted_action = np.empty(self.robot_dof + len(self.gripper_joints))
         self.reset_visualized_indicator()
         self.min_world_size = [-1.2, -1.2, 0.0]
         self.max_world_size = [1.2, 1.2, 2.0]
@@ -55,6 +73,9 @@ class SawyerEnv(BaseEnv):
             self.sim.model.geom_rgba[idx].copy() for idx in self.agent_geom_ids
         ]
 
+        # compile the gravity compensation kernel before the first step
+        _apply_gravity_comp(np.zeros(1), np.zeros(1), np.zeros(1, dtype=np.intp))
+
     @property
     def action_spec(self):
         """
@@ -107,15 +128,15 @@ class SawyerEnv(BaseEnv):
 
     @property
     def gripper_bodies(self):
-        return ["clawGripper", "rightclaw", "leftclaw"]
+        return ("clawGripper", "rightclaw", "leftclaw")
 
     @property
     def gripper_target_bodies(self):
-        return ["clawGripper_target", "rightclaw_target", "leftclaw_target"]
+        return ("clawGripper_target", "rightclaw_target", "leftclaw_target")
 
     @property
     def gripper_indicator_bodies(self):
-        return ["clawGripper_indicator", "rightclaw_indicator", "leftclaw_indicator"]
+        return ("clawGripper_indicator", "rightclaw_indicator", "leftclaw_indicator")
 
     @property
     def gripper_init_qpos(self):
@@ -167,6 +188,16 @@ class SawyerEnv(BaseEnv):
             self.sim.model.get_joint_qvel_addr(x) for x in self.robot_joints
         ]
 
+        # indices in qfrc_applied that are compensated for gravity at every step
+        gravity_comp_indexes = [self.ref_joint_vel_indexes]
+        if self.use_robot_indicator:
+            gravity_comp_indexes.append(self.ref_indicator_joint_pos_indexes)
+        if self.use_target_robot_indicator:
+            gravity_comp_indexes.append(self.ref_target_indicator_joint_pos_indexes)
+        self._gravity_comp_indexes = np.concatenate(gravity_comp_indexes).astype(
+            np.intp
+        )
+
         # indices for grippers in qpos, qvel
         self.ref_gripper_joint_pos_indexes = [
             self.sim.model.get_joint_qpos_addr(x) for x in self.gripper_joints
@@ -196,6 +227,11 @@ class SawyerEnv(BaseEnv):
 
         # # IDs of sites for gripper visualization
         self.eef_site_id = self.sim.model.site_name2id("grip_site")
+        self.eef_body_id = self.sim.model.body_name2id("right_ee_attchment")
+        self._gripper_body_ids = np.fromiter(
+            (self.sim.model.body_name2id(name) for name in self.gripper_bodies),
+            dtype=np.int32,
+        )
         # self.eef_cylinder_id = self.sim.model.site_name2id("grip_site_cylinder")
 
     def visualize_goal_indicator(self, qpos):
@@ -236,8 +272,10 @@ class SawyerEnv(BaseEnv):
     @property
     def agent_geom_ids(self):
         body_ids = []
-        for body_name in self.robot_bodies + self.gripper_bodies:
+        for body_name in self.robot_bodies:
             body_ids.append(self.sim.model.body_name2id(body_name))
+        # gripper body ids are resolved once in _get_reference
+        body_ids.extend(self._gripper_body_ids.tolist())
 
         geom_ids = []
         for geom_id, body_id in enumerate(self.sim.model.geom_bodyid):
@@ -250,7 +288,7 @@ class SawyerEnv(BaseEnv):
         if self.use_target_robot_indicator:
             body_ids = []
             for body_name in (
-                self.target_robot_indicator_bodies + self.gripper_target_bodies
+                self.target_robot_indicator_bodies + list(self.gripper_target_bodies)
             ):
                 body_ids.append(self.sim.model.body_name2id(body_name))
 
@@ -267,7 +305,7 @@ class SawyerEnv(BaseEnv):
         if self.use_robot_indicator:
             body_ids = []
             for body_name in (
-                self.robot_indicator_bodies + self.gripper_indicator_bodies
+                self.robot_indicator_bodies + list(self.gripper_indicator_bodies)
             ):
                 body_ids.append(self.sim.model.body_name2id(body_name))
 
@@ -315,30 +353,35 @@ class SawyerEnv(BaseEnv):
 
     def _get_obs(self):
         di = super()._get_obs()
-        di["joint_pos"] = np.array(
-            [self.sim.data.qpos[x] for x in self.ref_joint_pos_indexes]
-        )
-        di["joint_vel"] = np.array(
-            [self.sim.data.qvel[x] for x in self.ref_joint_vel_indexes]
-        )
+        sim_data = self.sim.data
+        # one fancy-indexed fetch per field instead of a read per joint
+        di["joint_pos"] = sim_data.qpos[self.ref_joint_pos_indexes]
+        di["joint_vel"] = sim_data.qvel[self.ref_joint_vel_indexes]
 
-        di["gripper_qpos"] = np.array(
-            [self.sim.data.qpos[x] for x in self.ref_gripper_joint_pos_indexes]
-        )
-        di["gripper_qvel"] = np.array(
-            [self.sim.data.qvel[x] for x in self.ref_gripper_joint_vel_indexes]
-        )
+        di["gripper_qpos"] = sim_data.qpos[self.ref_gripper_joint_pos_indexes]
+        di["gripper_qvel"] = sim_data.qvel[self.ref_gripper_joint_vel_indexes]
 
-        di["eef_pos"] = np.array(self.sim.data.site_xpos[self.eef_site_id])
-        di["eef_quat"] = convert_quat(
-            self.sim.data.get_body_xquat("right_ee_attchment"), to="xyzw"
-        )
+        di["eef_pos"] = np.array(sim_data.site_xpos[self.eef_site_id])
+        di["eef_quat"] = sim_data.body_xquat[self.eef_body_id][self._wxyz2xyzw]
 
         return di
 
-    def _gripper_format_action(self, gripper_ac):
+    def _gripper_format_action(self, gripper_ac, out=None):
         gripper_state = self.sim.data.qpos[self.ref_gripper_joint_pos_indexes]
-        return gripper_state + gripper_ac
+        return np.add(gripper_state, gripper_ac, out=out)
+
+    def _inner_sim_loop(self, converted_action):
+        """
+        Runs the physics steps of one env step towards @converted_action,
+        compensating gravity on the robot and indicator joints before each.
+        """
+        sim_data = self.sim.data
+        qfrc_applied = sim_data.qfrc_applied
+        qfrc_bias = sim_data.qfrc_bias
+        idx = self._gravity_comp_indexes
+        for _ in range(self._n_inner_loop):
+            _apply_gravity_comp(qfrc_applied, qfrc_bias, idx)
+            self._do_simulation(converted_action)
 
     def _step(self, action, is_planner=False):
         """
@@ -347,7 +390,9 @@ class SawyerEnv(BaseEnv):
         assert len(action) == self.dof, "environment got invalid action dimension"
 
         if not is_planner or self._prev_state is None:
-            self._prev_state = self.sim.data.qpos[self.ref_joint_pos_indexes].copy()
+            self._prev_state = np.take(
+                self.sim.data.qpos, self.ref_joint_pos_indexes, out=self._prev_state_buf
+            )
 
         if self._i_term is None:
             self._i_term = np.zeros_like(self.mujoco_robot.dof)
@@ -355,31 +400,18 @@ class SawyerEnv(BaseEnv):
         if is_planner:
             rescaled_ac = action[: self.robot_dof]
         else:
-            rescaled_ac = action[: self.robot_dof] * self._ac_scale
-        desired_state = self._prev_state + rescaled_ac
-        arm_action = desired_state
-        gripper_action = self._gripper_format_action(np.array([action[-1]]))
-        converted_action = np.concatenate([arm_action, gripper_action])
-
-        n_inner_loop = int(self._frame_dt / self.dt)
-        for _ in range(n_inner_loop):
-            self.sim.data.qfrc_applied[
-                self.ref_joint_vel_indexes
-            ] = self.sim.data.qfrc_bias[self.ref_joint_vel_indexes].copy()
-            if self.use_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[self.ref_indicator_joint_pos_indexes].copy()
-
-            if self.use_target_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_target_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[
-                    self.ref_target_indicator_joint_pos_indexes
-                ].copy()
-            self._do_simulation(converted_action)
+            rescaled_ac = np.multiply(
+                action[: self.robot_dof], self._ac_scale, out=self._clip_out
+            )
+        np.add(self._prev_state, rescaled_ac, out=self._prev_state)
+        converted_action = self._converted_action
+        converted_action[: self.robot_dof] = self._prev_state
+        self._gripper_format_action(
+            action[-1], out=converted_action[self.robot_dof :]
+        )
+
+        self._inner_sim_loop(converted_action)
 
-        self._prev_state = np.copy(desired_state)
         reward, info = self.compute_reward(action)
 
         return self._get_obs(), reward, self._terminal, info
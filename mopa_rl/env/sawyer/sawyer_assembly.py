@@ -91,43 +91,27 @@ class SawyerAssemblyEnv(SawyerEnv):
         assert len(action) == self.dof, "environment got invalid action dimension"
 
         if not is_planner or self._prev_state is None:
-            self._prev_state = self.sim.data.qpos[self.ref_joint_pos_indexes].copy()
+            self._prev_state = np.take(
+                self.sim.data.qpos, self.ref_joint_pos_indexes, out=self._prev_state_buf
+            )
 
         if self._i_term is None:
             self._i_term = np.zeros_like(self.mujoco_robot.dof)
 
         if is_planner:
             rescaled_ac = np.clip(
-                action[: self.robot_dof], -self._ac_scale, self._ac_scale
+                action[: self.robot_dof], self._ac_lo, self._ac_hi, out=self._clip_out
             )
         else:
-            rescaled_ac = np.clip(
-                action[: self.robot_dof] * self._ac_scale,
-                -self._ac_scale,
-                self._ac_scale,
+            rescaled_ac = np.multiply(
+                action[: self.robot_dof], self._ac_scale, out=self._clip_out
             )
-        desired_state = self._prev_state + rescaled_ac
-
-        n_inner_loop = int(self._frame_dt / self.dt)
-        for _ in range(n_inner_loop):
-            self.sim.data.qfrc_applied[
-                self.ref_joint_vel_indexes
-            ] = self.sim.data.qfrc_bias[self.ref_joint_vel_indexes].copy()
-
-            if self.use_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[self.ref_indicator_joint_pos_indexes].copy()
-
-            if self.use_target_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_target_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[
-                    self.ref_target_indicator_joint_pos_indexes
-                ].copy()
-            self._do_simulation(desired_state)
-
-        self._prev_state = np.copy(desired_state)
+            np.clip(rescaled_ac, self._ac_lo, self._ac_hi, out=rescaled_ac)
+        np.add(self._prev_state, rescaled_ac, out=self._prev_state)
+
+        # these tasks have no gripper, so the joint targets are the action
+        self._inner_sim_loop(self._prev_state)
+
         reward, info = self.compute_reward(action)
 
         return self._get_obs(), reward, self._terminal, info
@@ -1,6 +1,12 @@
 import numpy as np
 
 from mopa_rl.env.sawyer.sawyer import SawyerEnv
+from mopa_rl.env.sawyer.sawyer_lift import (
+    _GRIPPER_BODIES,
+    _GRIPPER_INDICATOR_BODIES,
+    _GRIPPER_TARGET_BODIES,
+    _reach_norm,
+)
 from mopa_rl.util.transform_utils import *
 
 
@@ -8,6 +14,9 @@ class SawyerLiftObstacleEnv(SawyerEnv):
     def __init__(self, **kwargs):
         super().__init__("sawyer_lift_obstacle.xml", **kwargs)
         self._get_reference()
+        self._noise_buf = np.empty_like(self.init_qpos)
+        # compile the reward kernel before the first episode starts
+        _reach_norm(np.zeros(3), np.zeros(3))
 
     @property
     def init_qpos(self):
@@ -20,21 +29,43 @@ class SawyerLiftObstacleEnv(SawyerEnv):
         self.cube_geom_id = self.sim.model.geom_name2id("cube")
         self.cube_site_id = self.sim.model.site_name2id("cube")
 
-    def _reset(self):
-        init_qpos = (
-            self.init_qpos + self.np_random.randn(self.init_qpos.shape[0]) * 0.02
+        # geom ids are fixed for a model, so resolve them once
+        static_body_ids = [
+            self.sim.model.body_name2id(name) for name in self.static_bodies
+        ]
+        self._static_geom_ids = np.where(
+            np.isin(self.sim.model.geom_bodyid, static_body_ids)
+        )[0].astype(np.int32)
+        self._manipulation_geom_ids = np.array(
+            [self.sim.model.geom_name2id(name) for name in self.manipulation_geom],
+            dtype=np.int32,
+        )
+        # finger ids are only used for membership tests in the contact loop,
+        # where a tuple of ints is faster than an ndarray
+        self._l_finger_geom_ids = tuple(
+            self.sim.model.geom_name2id(name) for name in self.left_finger_geoms
+        )
+        self._r_finger_geom_ids = tuple(
+            self.sim.model.geom_name2id(name) for name in self.right_finger_geoms
         )
+
+    def _sample_init_qpos(self):
+        init_qpos = self._noise_buf
+        self._rng.standard_normal(out=init_qpos)
+        init_qpos *= 0.02
+        init_qpos += self.init_qpos
+        return init_qpos
+
+    def _reset(self):
+        init_qpos = self._sample_init_qpos()
         self.sim.data.qpos[self.ref_joint_pos_indexes] = init_qpos
         self.sim.data.qvel[self.ref_joint_vel_indexes] = 0.0
-        self.sim.data.qvel[self.ref_joint_vel_indexes] = 0.0
         self.sim.forward()
 
         return self._get_obs()
 
     def initialize_joints(self):
-        init_qpos = (
-            self.init_qpos + self.np_random.randn(self.init_qpos.shape[0]) * 0.02
-        )
+        init_qpos = self._sample_init_qpos()
         self.sim.data.qpos[self.ref_joint_pos_indexes] = init_qpos
         self.sim.data.qvel[self.ref_joint_vel_indexes] = 0.0
         self.sim.forward()
@@ -49,48 +80,31 @@ class SawyerLiftObstacleEnv(SawyerEnv):
 
     @property
     def l_finger_geom_ids(self):
-        return [self.sim.model.geom_name2id(name) for name in self.left_finger_geoms]
+        return self._l_finger_geom_ids
 
     @property
     def r_finger_geom_ids(self):
-        return [self.sim.model.geom_name2id(name) for name in self.right_finger_geoms]
+        return self._r_finger_geom_ids
 
     @property
     def gripper_bodies(self):
-        return [
-            "clawGripper",
-            "rightclaw",
-            "leftclaw",
-            "right_gripper_base",
-            "right_gripper",
-            "r_gripper_l_finger_tip",
-            "r_gripper_r_finger_tip",
-        ]
+        return _GRIPPER_BODIES
 
     @property
     def gripper_indicator_bodies(self):
-        return [
-            "clawGripper_indicator",
-            "rightclaw_indicator",
-            "leftclaw_indicator",
-            "right_gripper_base_indicator",
-            "r_gripper_l_finger_tip_indicator",
-            "r_gripper_r_finger_tip_indicator",
-        ]
+        return _GRIPPER_INDICATOR_BODIES
 
     @property
     def gripper_target_bodies(self):
-        return [
-            "clawGripper_target",
-            "rightclaw_target",
-            "leftclaw_target",
-            "right_gripper_base_target",
-            "r_gripper_l_finger_tip_target",
-            "r_gripper_r_finger_tip_target",
-        ]
+        return _GRIPPER_TARGET_BODIES
 
     def compute_reward(self, action):
-        reward_type = self._kwargs["reward_type"]
+        sim_data = self.sim.data
+        return self._compute_reward(
+            sim_data.body_xpos[self.cube_body_id], sim_data.site_xpos[self.eef_site_id]
+        )
+
+    def _compute_reward(self, cube_pos, gripper_site_pos):
         info = {}
         reward = 0
 
@@ -100,30 +114,30 @@ class SawyerLiftObstacleEnv(SawyerEnv):
         hover_mult = 0.7
 
         reward_reach = 0.0
-        gripper_site_pos = self.sim.data.get_site_xpos("grip_site")
-        cube_pos = np.array(self.sim.data.body_xpos[self.cube_body_id])
-        gripper_to_cube = np.linalg.norm(cube_pos - gripper_site_pos)
+        gripper_to_cube = _reach_norm(cube_pos, gripper_site_pos)
         reward_reach = (1 - np.tanh(10 * gripper_to_cube)) * reach_mult
 
         touch_left_finger = False
         touch_right_finger = False
+        l_finger_geom_ids = self._l_finger_geom_ids
+        r_finger_geom_ids = self._r_finger_geom_ids
         for i in range(self.sim.data.ncon):
             c = self.sim.data.contact[i]
             if c.geom1 == self.cube_geom_id:
-                if c.geom2 in self.l_finger_geom_ids:
+                if c.geom2 in l_finger_geom_ids:
                     touch_left_finger = True
-                if c.geom2 in self.r_finger_geom_ids:
+                if c.geom2 in r_finger_geom_ids:
                     touch_right_finger = True
             elif c.geom2 == self.cube_geom_id:
-                if c.geom1 in self.l_finger_geom_ids:
+                if c.geom1 in l_finger_geom_ids:
                     touch_left_finger = True
-                if c.geom1 in self.r_finger_geom_ids:
+                if c.geom1 in r_finger_geom_ids:
                     touch_right_finger = True
         has_grasp = touch_right_finger and touch_left_finger
         reward_grasp = int(has_grasp) * grasp_mult
 
         reward_lift = 0.0
-        object_z_locs = self.sim.data.body_xpos[self.cube_body_id][2]
+        object_z_locs = cube_pos[2]
         if reward_grasp > 0.0:
             z_target = self._get_pos("bin1")[2] + 0.45
             z_dist = np.maximum(z_target - object_z_locs, 0.0)
@@ -148,18 +162,45 @@ class SawyerLiftObstacleEnv(SawyerEnv):
         return reward, info
 
     def _get_obs(self):
+        sim_data = self.sim.data
+        return self._build_obs(
+            sim_data.body_xpos[self.cube_body_id], sim_data.site_xpos[self.eef_site_id]
+        )
+
+    def _build_obs(self, cube_pos, gripper_site_pos):
         di = super()._get_obs()
-        cube_pos = np.array(self.sim.data.body_xpos[self.cube_body_id])
-        cube_quat = convert_quat(
-            np.array(self.sim.data.body_xquat[self.cube_body_id]), to="xyzw"
+        # observations are kept by reference in rollouts and the replay buffer,
+        # so a fresh block is needed every step; fill all fields of it in place
+        obs_buf = np.empty(10)
+        ob_cube_pos, ob_cube_quat, ob_gripper_to_cube = (
+            obs_buf[:3],
+            obs_buf[3:7],
+            obs_buf[7:],
         )
-        di["cube_pos"] = cube_pos
-        di["cube_quat"] = cube_quat
-        gripper_site_pos = np.array(self.sim.data.site_xpos[self.eef_site_id])
-        di["gripper_to_cube"] = gripper_site_pos - cube_pos
+        np.copyto(ob_cube_pos, cube_pos)
+        np.take(
+            self.sim.data.body_xquat[self.cube_body_id],
+            self._wxyz2xyzw,
+            out=ob_cube_quat,
+        )
+        np.subtract(gripper_site_pos, cube_pos, out=ob_gripper_to_cube)
+        di["cube_pos"] = ob_cube_pos
+        di["cube_quat"] = ob_cube_quat
+        di["gripper_to_cube"] = ob_gripper_to_cube
 
         return di
 
+    def _observe_and_reward(self, action):
+        """
+        Reads the cube and gripper site positions once and returns
+        (obs, reward, info) for the current sim state.
+        """
+        sim_data = self.sim.data
+        cube_pos = sim_data.body_xpos[self.cube_body_id]
+        gripper_site_pos = sim_data.site_xpos[self.eef_site_id]
+        reward, info = self._compute_reward(cube_pos, gripper_site_pos)
+        return self._build_obs(cube_pos, gripper_site_pos), reward, info
+
     @property
     def static_bodies(self):
         return ["table", "bin1"]
@@ -170,15 +211,7 @@ class SawyerLiftObstacleEnv(SawyerEnv):
 
     @property
     def static_geom_ids(self):
-        body_ids = []
-        for body_name in self.static_bodies:
-            body_ids.append(self.sim.model.body_name2id(body_name))
-
-        geom_ids = []
-        for geom_id, body_id in enumerate(self.sim.model.geom_bodyid):
-            if body_id in body_ids:
-                geom_ids.append(geom_id)
-        return geom_ids
+        return self._static_geom_ids
 
     @property
     def manipulation_geom(self):
@@ -186,7 +219,7 @@ class SawyerLiftObstacleEnv(SawyerEnv):
 
     @property
     def manipulation_geom_ids(self):
-        return [self.sim.model.geom_name2id(name) for name in self.manipulation_geom]
+        return self._manipulation_geom_ids
 
     def _step(self, action, is_planner=False):
         """
@@ -195,46 +228,31 @@ class SawyerLiftObstacleEnv(SawyerEnv):
         assert len(action) == self.dof, "environment got invalid action dimension"
 
         if not is_planner or self._prev_state is None:
-            self._prev_state = self.sim.data.qpos[self.ref_joint_pos_indexes].copy()
+            self._prev_state = np.take(
+                self.sim.data.qpos, self.ref_joint_pos_indexes, out=self._prev_state_buf
+            )
 
         if self._i_term is None:
             self._i_term = np.zeros_like(self.mujoco_robot.dof)
 
         if is_planner:
             rescaled_ac = np.clip(
-                action[: self.robot_dof], -self._ac_scale, self._ac_scale
+                action[: self.robot_dof], self._ac_lo, self._ac_hi, out=self._clip_out
             )
         else:
-            rescaled_ac = np.clip(
-                action[: self.robot_dof] * self._ac_scale,
-                -self._ac_scale,
-                self._ac_scale,
+            rescaled_ac = np.multiply(
+                action[: self.robot_dof], self._ac_scale, out=self._clip_out
             )
-        desired_state = self._prev_state + rescaled_ac
-        arm_action = desired_state
-        gripper_action = self._gripper_format_action(np.array([action[-1]]))
-        converted_action = np.concatenate([arm_action, gripper_action])
-
-        n_inner_loop = int(self._frame_dt / self.dt)
-        for _ in range(n_inner_loop):
-            self.sim.data.qfrc_applied[
-                self.ref_joint_vel_indexes
-            ] = self.sim.data.qfrc_bias[self.ref_joint_vel_indexes].copy()
-
-            if self.use_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[self.ref_indicator_joint_pos_indexes].copy()
-
-            if self.use_target_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_target_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[
-                    self.ref_target_indicator_joint_pos_indexes
-                ].copy()
-            self._do_simulation(converted_action)
-
-        self._prev_state = np.copy(desired_state)
-        reward, info = self.compute_reward(action)
-
-        return self._get_obs(), reward, self._terminal, info
+            np.clip(rescaled_ac, self._ac_lo, self._ac_hi, out=rescaled_ac)
+        np.add(self._prev_state, rescaled_ac, out=self._prev_state)
+        converted_action = self._converted_action
+        converted_action[: self.robot_dof] = self._prev_state
+        self._gripper_format_action(
+            action[-1], out=converted_action[self.robot_dof :]
+        )
+
+        self._inner_sim_loop(converted_action)
+
+        ob, reward, info = self._observe_and_reward(action)
+
+        return ob, reward, self._terminal, info
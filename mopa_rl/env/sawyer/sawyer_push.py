@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 
 from mopa_rl.env.sawyer.sawyer import SawyerEnv
@@ -37,37 +39,39 @@ class SawyerPushEnv(SawyerEnv):
             init_target_qpos = self.np_random.uniform(low=-3, high=3, size=2)
         self.goal = init_target_qpos
         self.sim.data.qpos[self.ref_target_pos_indexes] = self.goal
-        self.sim.data.qvel[self.ref_joint_vel_indexes] = 0.0
         self.sim.forward()
 
         return self._get_obs()
 
     def compute_reward(self, action):
-        reward_type = self._kwargs["reward_type"]
         info = {}
         reward = 0
 
-        if reward_type == "dense":
+        right_gripper, left_gripper = (
+            self.sim.data.get_site_xpos("right_eef"),
+            self.sim.data.get_site_xpos("left_eef"),
+        )
+        gripper_site_pos = (right_gripper + left_gripper) / 2.0
+        cube_pos = np.array(self.sim.data.body_xpos[self.cube_body_id])
+        target_pos = self.sim.data.body_xpos[self.target_id]
+        diff = cube_pos - gripper_site_pos
+        dist_sq = diff @ diff
+        cube_to_target = math.hypot(
+            cube_pos[0] - target_pos[0], cube_pos[1] - target_pos[1]
+        )
+
+        if self._reward_type == "dense":
             reach_multi = 0.6
             push_multi = 1.0
-            right_gripper, left_gripper = (
-                self.sim.data.get_site_xpos("right_eef"),
-                self.sim.data.get_site_xpos("left_eef"),
-            )
-            gripper_site_pos = (right_gripper + left_gripper) / 2.0
-            cube_pos = np.array(self.sim.data.body_xpos[self.cube_body_id])
-            target_pos = self.sim.data.body_xpos[self.target_id]
-            gripper_to_cube = np.linalg.norm(cube_pos - gripper_site_pos)
-            cube_to_target = np.linalg.norm(cube_pos[:2] - target_pos[:2])
+            gripper_to_cube = math.sqrt(dist_sq)
             reward_reach = -gripper_to_cube * reach_multi
             reward_push = -cube_to_target * push_multi
             reward += reward_reach + reward_push
             info = dict(reward_reach=reward_reach, reward_push=reward_push)
         else:
-            gripper_to_cube = np.linalg.norm(cube_pos - gripper_site_pos)
-            cube_to_target = np.linalg.norm(cube_pos[:2] - target_pos[:2])
-            reward_reach = -(gripper_to_cube > 0.15)
-            reward_push = -(cube_to_target > self._kwargs["distance_threshold"])
+            # compare against 0.15 ** 2 to skip the sqrt
+            reward_reach = -float(dist_sq > 0.0225)
+            reward_push = -float(cube_to_target > self._kwargs["distance_threshold"])
             reward += reward_reach
             reward += reward_push
             info = dict(reward_reach=reward_reach, reward_push=reward_push)
@@ -118,42 +122,30 @@ class SawyerPushEnv(SawyerEnv):
         assert len(action) == self.dof, "environment got invalid action dimension"
 
         if not is_planner or self._prev_state is None:
-            self._prev_state = self.sim.data.qpos[self.ref_joint_pos_indexes].copy()
+            self._prev_state = np.take(
+                self.sim.data.qpos, self.ref_joint_pos_indexes, out=self._prev_state_buf
+            )
 
         if self._i_term is None:
             self._i_term = np.zeros_like(self.mujoco_robot.dof)
 
         if is_planner:
             rescaled_ac = np.clip(
-                action[: self.robot_dof], -self._ac_scale, self._ac_scale
+                action[: self.robot_dof], self._ac_lo, self._ac_hi, out=self._clip_out
             )
         else:
-            rescaled_ac = action[: self.robot_dof] * self._ac_scale
-        desired_state = self._prev_state + rescaled_ac
-        arm_action = desired_state
-        gripper_action = self._gripper_format_action(np.array([action[-1]]))
-        converted_action = np.concatenate([arm_action, gripper_action])
-
-        n_inner_loop = int(self._frame_dt / self.dt)
-        for _ in range(n_inner_loop):
-            self.sim.data.qfrc_applied[
-                self.ref_joint_vel_indexes
-            ] = self.sim.data.qfrc_bias[self.ref_joint_vel_indexes].copy()
-
-            if self.use_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[self.ref_indicator_joint_pos_indexes].copy()
-
-            if self.use_target_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_target_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[
-                    self.ref_target_indicator_joint_pos_indexes
-                ].copy()
-            self._do_simulation(converted_action)
-
-        self._prev_state = np.copy(desired_state)
+            rescaled_ac = np.multiply(
+                action[: self.robot_dof], self._ac_scale, out=self._clip_out
+            )
+        np.add(self._prev_state, rescaled_ac, out=self._prev_state)
+        converted_action = self._converted_action
+        converted_action[: self.robot_dof] = self._prev_state
+        self._gripper_format_action(
+            action[-1], out=converted_action[self.robot_dof :]
+        )
+
+        self._inner_sim_loop(converted_action)
+
         reward, info = self.compute_reward(action)
 
         return self._get_obs(), reward, self._terminal, info
@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 
 from mopa_rl.env.sawyer.sawyer import SawyerEnv
@@ -45,7 +47,6 @@ class SawyerPushObstacleEnv(SawyerEnv):
         )
         self.goal = init_target_qpos
         self.sim.data.qpos[self.ref_target_pos_indexes] = self.goal
-        self.sim.data.qvel[self.ref_joint_vel_indexes] = 0.0
         self.sim.forward()
 
         return self._get_obs()
@@ -69,7 +70,6 @@ class SawyerPushObstacleEnv(SawyerEnv):
         return touch
 
     def compute_reward(self, action):
-        reward_type = self._kwargs["reward_type"]
         info = {}
         reward = 0
 
@@ -80,11 +80,16 @@ class SawyerPushObstacleEnv(SawyerEnv):
         gripper_site_pos = (right_gripper + left_gripper) / 2.0
         cube_pos = np.array(self.sim.data.body_xpos[self.cube_body_id])
         target_pos = self.sim.data.body_xpos[self.target_id]
-        gripper_to_cube = np.linalg.norm(cube_pos - gripper_site_pos)
-        cube_to_target = np.linalg.norm(cube_pos[:2] - target_pos[:2])
+        diff = cube_pos - gripper_site_pos
+        dist_sq = diff @ diff
+        cube_to_target = math.hypot(
+            cube_pos[0] - target_pos[0], cube_pos[1] - target_pos[1]
+        )
         reward_push = 0.0
         reward_reach = 0.0
-        if gripper_to_cube < 0.1:
+        # compare against 0.1 ** 2 so the sqrt is only taken inside the band
+        if dist_sq < 0.01:
+            gripper_to_cube = math.sqrt(dist_sq)
             reward_reach += 0.1 * (1 - np.tanh(10 * gripper_to_cube))
 
         if cube_to_target < 0.1:
@@ -166,43 +171,27 @@ class SawyerPushObstacleEnv(SawyerEnv):
         assert len(action) == self.dof, "environment got invalid action dimension"
 
         if not is_planner or self._prev_state is None:
-            self._prev_state = self.sim.data.qpos[self.ref_joint_pos_indexes].copy()
+            self._prev_state = np.take(
+                self.sim.data.qpos, self.ref_joint_pos_indexes, out=self._prev_state_buf
+            )
 
         if self._i_term is None:
             self._i_term = np.zeros_like(self.mujoco_robot.dof)
 
         if is_planner:
             rescaled_ac = np.clip(
-                action[: self.robot_dof], -self._ac_scale, self._ac_scale
+                action[: self.robot_dof], self._ac_lo, self._ac_hi, out=self._clip_out
             )
         else:
-            rescaled_ac = np.clip(
-                action[: self.robot_dof] * self._ac_scale,
-                -self._ac_scale,
-                self._ac_scale,
+            rescaled_ac = np.multiply(
+                action[: self.robot_dof], self._ac_scale, out=self._clip_out
             )
-        desired_state = self._prev_state + rescaled_ac
-
-        n_inner_loop = int(self._frame_dt / self.dt)
-        for _ in range(n_inner_loop):
-            self.sim.data.qfrc_applied[
-                self.ref_joint_vel_indexes
-            ] = self.sim.data.qfrc_bias[self.ref_joint_vel_indexes].copy()
-
-            if self.use_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[self.ref_indicator_joint_pos_indexes].copy()
-
-            if self.use_target_robot_indicator:
-                self.sim.data.qfrc_applied[
-                    self.ref_target_indicator_joint_pos_indexes
-                ] = self.sim.data.qfrc_bias[
-                    self.ref_target_indicator_joint_pos_indexes
-                ].copy()
-            self._do_simulation(desired_state)
-
-        self._prev_state = np.copy(desired_state)
+            np.clip(rescaled_ac, self._ac_lo, self._ac_hi, out=rescaled_ac)
+        np.add(self._prev_state, rescaled_ac, out=self._prev_state)
+
+        # these tasks have no gripper, so the joint targets are the action
+        self._inner_sim_loop(self._prev_state)
+
         reward, info = self.compute_reward(action)
 
         return self._get_obs(), reward, self._terminal, info
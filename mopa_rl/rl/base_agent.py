@@ -1,16 +1,22 @@
 from gym import spaces
 import numpy as np
+import torch
+
+from mopa_rl.util.pytorch import to_tensor_async
 
 
 class BaseAgent(object):
     def __init__(self, config, ob_space):
         self._config = config
+        self._copy_stream = None
 
     def normalize(self, ob):
         if self._config.ob_norm:
             return self._ob_norm.normalize(ob)
         return ob
 
+    # actions are only consumed as numpy, so no autograd state is recorded
+    @torch.inference_mode()
     def act(self, ob, is_train=True, return_stds=False, random_exploration=False):
         if random_exploration:
             ac = self._ac_space.sample()
@@ -32,6 +38,14 @@ class BaseAgent(object):
             )
             return ac, activation
 
+    def _to_device(self, transitions):
+        device = self._config.device
+        if device.type != "cuda":
+            return transitions
+        if self._copy_stream is None:
+            self._copy_stream = torch.cuda.Stream(device)
+        return to_tensor_async(transitions, device, self._copy_stream)
+
     def store_episode(self, rollouts):
         raise NotImplementedError()
 
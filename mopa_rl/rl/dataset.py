@@ -1,11 +1,128 @@
-from collections import defaultdict
+from collections import OrderedDict
 from time import time
 
+import h5py
 import numpy as np
 
 
+# smallest quantization step, used while an observation dim has one value
+_MIN_SCALE = 1e-6
+
+
+def _allocate(value, size, keep_int=True):
+    """
+    Preallocates @size rows shaped like @value, recursing into dicts.
+    With @keep_int, integer and boolean values, such as discrete actions and
+    done flags, keep their dtype; other numeric values are kept as float32,
+    the dtype they are trained with.
+    """
+    if isinstance(value, dict):
+        return OrderedDict(
+            [(k, _allocate(v, size, keep_int)) for k, v in value.items()]
+        )
+    if value is None:
+        return np.empty(size, dtype=object)
+    value = np.asarray(value)
+    keep = keep_int and value.dtype.kind in "biu"
+    dtype = value.dtype if keep else np.float32
+    return np.empty((size,) + value.shape, dtype=dtype)
+
+
+def _allocate_like(array, size):
+    if isinstance(array, dict):
+        return OrderedDict([(k, _allocate_like(v, size)) for k, v in array.items()])
+    return np.empty((size,) + array.shape[1:], dtype=array.dtype)
+
+
+def _write(array, idx, value):
+    if isinstance(array, dict):
+        for k, v in value.items():
+            array[k][idx] = v
+    else:
+        array[idx] = value
+
+
+def _copy(array, src, size):
+    if isinstance(array, dict):
+        for k in array.keys():
+            _copy(array[k], src[k], size)
+    else:
+        array[:size] = src[:size]
+
+
+def _slice(array, size):
+    if isinstance(array, dict):
+        return OrderedDict([(k, _slice(v, size)) for k, v in array.items()])
+    return array[:size]
+
+
+def _gather(array, idxs):
+    if isinstance(array, dict):
+        return OrderedDict([(k, _gather(v, idxs)) for k, v in array.items()])
+    return array[idxs]
+
+
+def _write_replay_group(group, buffers):
+    for k, v in buffers.items():
+        if isinstance(v, dict):
+            _write_replay_group(group.create_group(k, track_order=True), v)
+        elif v.dtype == object:
+            # placeholder keys such as meta_ac only hold None
+            group.attrs[k] = len(v)
+        else:
+            group.create_dataset(k, data=v, chunks=True, compression="lzf")
+
+
+def _read_replay_group(group):
+    buffers = OrderedDict()
+    for k, v in group.items():
+        buffers[k] = _read_replay_group(v) if isinstance(v, h5py.Group) else v
+    for k, n in group.attrs.items():
+        buffers[k] = np.full(n, None, dtype=object)
+    return buffers
+
+
+def write_replay_h5(hf, state_dict):
+    """
+    Writes a ReplayBuffer @state_dict into the open h5py file @hf.
+    """
+    hf.attrs["idx"] = state_dict["idx"]
+    hf.attrs["current_size"] = state_dict["current_size"]
+    for key in ["buffers", "ob_range"]:
+        if state_dict[key] is not None:
+            _write_replay_group(hf.create_group(key, track_order=True), state_dict[key])
+
+
+def read_replay_h5(hf):
+    """
+    Reads a ReplayBuffer state dict from the open h5py file @hf. The arrays
+    are h5py datasets, so it has to be loaded before the file is closed.
+    """
+    state_dict = {
+        "idx": int(hf.attrs["idx"]),
+        "current_size": int(hf.attrs["current_size"]),
+    }
+    for key in ["buffers", "ob_range"]:
+        state_dict[key] = _read_replay_group(hf[key]) if key in hf else None
+    return state_dict
+
+
 class ReplayBuffer:
-    def __init__(self, keys, buffer_size, sample_func):
+    """
+    Stores transitions in preallocated arrays, one per key and per sub-key of
+    dict-valued keys such as observations. The next observation of every
+    transition is kept under "ob_next".
+
+    With @quantize_ob, observations are stored as uint8 with a per-dimension
+    offset and scale that grow to cover every value seen so far, and are
+    dequantized to float32 when sampled.
+    """
+
+    _ob_keys = ("ob", "ob_next")
+    # continuous keys whose first value may happen to be an integer
+    _float_keys = _ob_keys + ("rew",)
+
+    def __init__(self, keys, buffer_size, sample_func, quantize_ob=False):
         self._size = buffer_size
 
         # memory management
@@ -13,138 +130,183 @@ class ReplayBuffer:
         self._current_size = 0
         self._sample_func = sample_func
 
-        # create the buffer to store info
+        # the buffers are allocated on the first stored transition
         self._keys = keys
-        self._buffers = defaultdict(list)
+        self._buffers = None
+
+        self._quantize_ob = quantize_ob
+        self._ob_lo = None
+        self._ob_scale = None
 
     def clear(self):
         self._idx = 0
         self._current_size = 0
-        self._buffers = defaultdict(list)
+        self._buffers = None
+        self._ob_lo = None
+        self._ob_scale = None
+
+    def _allocate(self, transition):
+        self._buffers = OrderedDict(
+            [
+                (k, _allocate(v, self._size, k not in self._float_keys))
+                for k, v in transition.items()
+            ]
+        )
+        if self._quantize_ob:
+            self._ob_lo = OrderedDict()
+            self._ob_scale = OrderedDict()
+            for k, v in transition["ob"].items():
+                v = np.asarray(v, dtype=np.float32)
+                for ob_key in self._ob_keys:
+                    self._buffers[ob_key][k] = np.empty(
+                        (self._size,) + v.shape, dtype=np.uint8
+                    )
+                self._ob_lo[k] = v.copy()
+                self._ob_scale[k] = np.full_like(v, _MIN_SCALE)
+
+    def _expand_range(self, k, v_min, v_max):
+        lo, scale = self._ob_lo[k], self._ob_scale[k]
+        hi = lo + scale * 255
+        new_lo = np.minimum(lo, v_min)
+        new_hi = np.maximum(hi, v_max)
+        # widen the grown side by a margin so the range settles quickly
+        margin = 0.1 * (new_hi - new_lo)
+        new_lo = np.where(v_min < lo, new_lo - margin, new_lo)
+        new_hi = np.where(v_max > hi, new_hi + margin, new_hi)
+        new_scale = np.maximum((new_hi - new_lo) / 255, _MIN_SCALE)
+
+        # requantize the stored observations with the new range
+        for ob_key in self._ob_keys:
+            q = self._buffers[ob_key][k][: self._current_size]
+            x = q * scale + lo
+            q[...] = np.clip(np.rint((x - new_lo) / new_scale), 0, 255)
+        self._ob_lo[k] = new_lo.astype(np.float32)
+        self._ob_scale[k] = new_scale.astype(np.float32)
+
+    def _quantize(self, ob, ob_next):
+        q_ob, q_ob_next = OrderedDict(), OrderedDict()
+        for k in ob.keys():
+            v = np.asarray(ob[k], dtype=np.float32)
+            w = np.asarray(ob_next[k], dtype=np.float32)
+            v_min, v_max = np.minimum(v, w), np.maximum(v, w)
+            lo, scale = self._ob_lo[k], self._ob_scale[k]
+            if np.any(v_min < lo) or np.any(v_max > lo + scale * 255):
+                self._expand_range(k, v_min, v_max)
+                lo, scale = self._ob_lo[k], self._ob_scale[k]
+            q_ob[k] = np.clip(np.rint((v - lo) / scale), 0, 255)
+            q_ob_next[k] = np.clip(np.rint((w - lo) / scale), 0, 255)
+        return q_ob, q_ob_next
+
+    def _dequantize(self, ob):
+        return OrderedDict(
+            [
+                (k, q.astype(np.float32) * self._ob_scale[k] + self._ob_lo[k])
+                for k, q in ob.items()
+            ]
+        )
 
     # store the episode
     def store_episode(self, rollout):
-        idx = self._idx = (self._idx + 1) % self._size
-        self._current_size += 1
+        for t in range(len(rollout["ac"])):
+            transition = {k: rollout[k][t] for k in self._keys}
+            transition["ob_next"] = rollout["ob"][t + 1]
+            if self._buffers is None:
+                self._allocate(transition)
+            if self._quantize_ob:
+                transition["ob"], transition["ob_next"] = self._quantize(
+                    transition["ob"], transition["ob_next"]
+                )
+            for k, v in transition.items():
+                _write(self._buffers[k], self._idx, v)
 
-        if self._current_size > self._size:
-            for k in self._keys:
-                self._buffers[k][idx] = rollout[k]
-        else:
-            for k in self._keys:
-                self._buffers[k].append(rollout[k])
+            self._idx = (self._idx + 1) % self._size
+            self._current_size = min(self._current_size + 1, self._size)
 
     # sample the data from the replay buffer
     def sample(self, batch_size):
         # sample transitions
-        transitions = self._sample_func(self._buffers, batch_size)
+        transitions = self._sample_func(self._buffers, self._current_size, batch_size)
+        if self._quantize_ob:
+            for ob_key in self._ob_keys:
+                transitions[ob_key] = self._dequantize(transitions[ob_key])
         return transitions
 
-    def state_dict(self):
-        return self._buffers
-
-    def load_state_dict(self, state_dict):
-        self._buffers = state_dict
-        self._current_size = len(self._buffers["ac"])
-
-
-class RandomSampler:
-    def sample_func(self, episode_batch, batch_size_in_transitions):
-        rollout_batch_size = len(episode_batch["ac"])
-        batch_size = batch_size_in_transitions
-        episode_idxs = np.random.randint(0, rollout_batch_size, batch_size)
-        t_samples = [
-            np.random.randint(len(episode_batch["ac"][episode_idx]))
-            for episode_idx in episode_idxs
-        ]
-
-        transitions = {}
-        for key in episode_batch.keys():
-            transitions[key] = [
-                episode_batch[key][episode_idx][t]
-                for episode_idx, t in zip(episode_idxs, t_samples)
-            ]
-
-        if "ob_next" not in episode_batch.keys():
-            transitions["ob_next"] = [
-                episode_batch["ob"][episode_idx][t + 1]
-                for episode_idx, t in zip(episode_idxs, t_samples)
-            ]
-
-        new_transitions = {}
-        for k, v in transitions.items():
-            if isinstance(v[0], dict):
-                sub_keys = v[0].keys()
-                new_transitions[k] = {
-                    sub_key: np.stack([v_[sub_key] for v_ in v]) for sub_key in sub_keys
-                }
-            else:
-                new_transitions[k] = np.stack(v)
+    def sample_batches(self, batch_size, num_batches, transform=None):
+        """
+        Samples @num_batches batches of @batch_size transitions with a single
+        index draw and a single gather per array. @transform, if given, is
+        applied to the whole block before it is split into batches.
+        """
+        transitions = self.sample((num_batches, batch_size))
+        if transform is not None:
+            transitions = transform(transitions)
+        return [_gather(transitions, i) for i in range(num_batches)]
 
-        return new_transitions
+    def column(self, key, sub_key):
+        """
+        Returns the stored values of @key[@sub_key] as a float array.
+        """
+        values = self._buffers[key][sub_key][: self._current_size]
+        if self._quantize_ob and key in self._ob_keys:
+            return self._dequantize({sub_key: values})[sub_key]
+        return values
 
+    def state_dict(self):
+        buffers = None
+        if self._buffers is not None:
+            buffers = _slice(self._buffers, self._current_size)
+        ob_range = None
+        if self._ob_lo is not None:
+            ob_range = OrderedDict(
+                [
+                    (k, np.stack([self._ob_lo[k], self._ob_scale[k]]))
+                    for k in self._ob_lo
+                ]
+            )
+        return {
+            "idx": self._idx,
+            "current_size": self._current_size,
+            "buffers": buffers,
+            "ob_range": ob_range,
+        }
 
-class HERSampler:
-    def __init__(self, replay_strategy, replay_k, reward_func=None):
-        self.replay_strategy = replay_strategy
-        if self.replay_strategy == "future":
-            self.future_p = 1 - (1.0 / 1 + replay_k)
-        else:
-            self.future_p = 0
-        self.reward_func = reward_func
-
-    def sample_func(self, episode_batch, batch_size_in_transitions):
-        rollout_batch_size = len(episode_batch["ac"])
-        batch_size = batch_size_in_transitions
-
-        # select which rollouts and which timesteps to be used
-        episode_idxs = np.random.randint(0, rollout_batch_size, batch_size)
-        t_samples = [
-            np.random.randint(len(episode_batch["ac"][episode_idx]))
-            for episode_idx in episode_idxs
-        ]
-
-        transitions = {}
-        for key in episode_batch.keys():
-            transitions[key] = [
-                episode_batch[key][episode_idx][t]
-                for episode_idx, t in zip(episode_idxs, t_samples)
-            ]
+    def load_state_dict(self, state_dict):
+        self.clear()
+        if "buffers" not in state_dict:
+            # buffers saved as lists of episodes
+            for i in range(len(state_dict["ac"])):
+                self.store_episode({k: v[i] for k, v in state_dict.items()})
+            return
 
-        transitions["ob_next"] = [
-            episode_batch["ob"][episode_idx][t + 1]
-            for episode_idx, t in zip(episode_idxs, t_samples)
-        ]
-        transitions["r"] = np.zeros((batch_size,))
-
-        # hindsight experience replay
-        for i, (episode_idx, t) in enumerate(zip(episode_idxs, t_samples)):
-            replace_goal = np.random.uniform() < self.future_p
-            if replace_goal:
-                future_t = np.random.randint(
-                    t + 1, len(episode_batch["ac"][episode_idx]) + 1
-                )
-                future_ag = episode_batch["ag"][episode_idx][future_t]
-                if (
-                    self.reward_func(
-                        episode_batch["ag"][episode_idx][t], future_ag, None
-                    )
-                    < 0
-                ):
-                    transitions["g"][i] = future_ag
+        buffers = state_dict["buffers"]
+        current_size = state_dict["current_size"]
+        ob_range = state_dict.get("ob_range")
+        if self._quantize_ob and ob_range is None and buffers is not None:
+            # buffers saved in float32 are quantized as they are re-inserted
+            for i in range(current_size):
+                row = _gather(buffers, i)
+                rollout = {k: [row[k]] for k in self._keys}
+                rollout["ob"] = [row["ob"], row["ob_next"]]
+                self.store_episode(rollout)
+            return
 
-            transitions["r"][i] = self.reward_func(
-                episode_batch["ag"][episode_idx][t + 1], transitions["g"][i], None
+        if ob_range is not None:
+            # the saved observations are only meaningful with their range
+            self._quantize_ob = True
+            self._ob_lo = OrderedDict(
+                [(k, np.array(v[0], dtype=np.float32)) for k, v in ob_range.items()]
             )
+            self._ob_scale = OrderedDict(
+                [(k, np.array(v[1], dtype=np.float32)) for k, v in ob_range.items()]
+            )
+        if buffers is not None:
+            self._buffers = _allocate_like(buffers, self._size)
+            _copy(self._buffers, buffers, current_size)
+        self._idx = state_dict["idx"]
+        self._current_size = current_size
+
 
-        new_transitions = {}
-        for k, v in transitions.items():
-            if isinstance(v[0], dict):
-                sub_keys = v[0].keys()
-                new_transitions[k] = {
-                    sub_key: np.stack([v_[sub_key] for v_ in v]) for sub_key in sub_keys
-                }
-            else:
-                new_transitions[k] = np.stack(v)
-
-        return new_transitions
+class RandomSampler:
+    def sample_func(self, buffers, current_size, batch_size):
+        idxs = np.random.randint(0, current_size, batch_size)
+        return _gather(buffers, idxs)
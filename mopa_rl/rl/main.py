@@ -13,6 +13,7 @@ from logging import CRITICAL
 from mopa_rl.config import argparser
 from mopa_rl.config.motion_planner import add_arguments as mp_add_arguments
 from mopa_rl.rl.trainer import Trainer
+from mopa_rl.util.mpi import init_distributed
 from mopa_rl.util.logger import logger
 
 
@@ -21,17 +22,19 @@ np.set_printoptions(suppress=True)
 
 
 def run(config):
-    rank = MPI.COMM_WORLD.Get_rank()
+    if config.distributed:
+        rank, num_workers, local_rank = init_distributed()
+    else:
+        rank = MPI.COMM_WORLD.Get_rank()
+        num_workers = MPI.COMM_WORLD.Get_size()
     config.rank = rank
     config.is_chef = rank == 0
     config.seed = config.seed + rank
-    config.num_workers = MPI.COMM_WORLD.Get_size()
+    config.num_workers = num_workers
     config.is_mpi = False if config.num_workers == 1 else True
 
     if torch.get_num_threads() != 1:
-        fair_num_threads = max(
-            int(torch.get_num_threads() / MPI.COMM_WORLD.Get_size()), 1
-        )
+        fair_num_threads = max(int(torch.get_num_threads() / num_workers), 1)
         torch.set_num_threads(fair_num_threads)
 
     if config.is_chef:
@@ -73,7 +76,10 @@ def run(config):
 
     os.environ["DISPLAY"] = ":1"
 
-    if config.gpu is not None:
+    if config.distributed and torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
+        config.device = torch.device("cuda", local_rank)
+    elif config.gpu is not None:
         os.environ["CUDA_VISIBLE_DEVICES"] = "{}".format(config.gpu)
         assert torch.cuda.is_available()
         config.device = torch.device("cuda")
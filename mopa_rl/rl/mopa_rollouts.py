@@ -12,14 +12,22 @@ from mopa_rl.rl.rollouts import Rollout
 
 
 class MoPARolloutRunner(object):
-    def __init__(self, config, env, env_eval, pi):
+    def __init__(self, config, env, make_env_eval, pi):
         self._config = config
         self._env = env
-        self._env_eval = env_eval
+        self._make_env_eval = make_env_eval
+        self._env_eval_instance = None
         #self._ik_env = gym.make(config.env, **config.__dict__)
         self._ik_env = None
         self._pi = pi
 
+    @property
+    def _env_eval(self):
+        # the evaluation env is only built once an evaluation runs
+        if self._env_eval_instance is None:
+            self._env_eval_instance = self._make_env_eval()
+        return self._env_eval_instance
+
     def run(
         self,
         max_step=10000,
@@ -1,6 +1,9 @@
+from functools import lru_cache
+
 from .mlp_actor_critic import MlpActor, MlpCritic
 
 
+@lru_cache(maxsize=None)
 def get_actor_critic_by_name(name):
     if name == "mlp":
         return MlpActor, MlpCritic
@@ -12,7 +12,7 @@ from rl.policies.distributions import (
     MixedDistribution,
     FixedGumbelSoftmax,
 )
-from util.pytorch import to_tensor
+from util.pytorch import to_tensor, to_tensor_packed
 
 
 class Actor(nn.Module):
@@ -27,7 +27,10 @@ class Actor(nn.Module):
         return {}
 
     def act(self, ob, is_train=True, return_log_prob=False, return_stds=False):
-        ob = to_tensor(ob, self._config.device)
+        if isinstance(ob, dict):
+            ob = to_tensor_packed(ob, self._config.device)
+        else:
+            ob = to_tensor(ob, self._config.device)
         self._ob = ob
         means, stds = self.forward(ob, self._deterministic)
 
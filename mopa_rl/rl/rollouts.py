@@ -37,15 +37,23 @@ class Rollout(object):
 
 
 class RolloutRunner(object):
-    def __init__(self, config, env, env_eval, pi):
+    def __init__(self, config, env, make_env_eval, pi):
         self._config = config
         self._env = env
-        self._env_eval = env_eval
+        self._make_env_eval = make_env_eval
+        self._env_eval_instance = None
         self._pi = pi
         #self._ik_env = gym.make(config.env, **config.__dict__)
         # set ik env to None now since none of our experiments require it
         self._ik_env = None
 
+    @property
+    def _env_eval(self):
+        # the evaluation env is only built once an evaluation runs
+        if self._env_eval_instance is None:
+            self._env_eval_instance = self._make_env_eval()
+        return self._env_eval_instance
+
     def run(
         self,
         max_step=10000,
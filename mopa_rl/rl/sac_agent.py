@@ -64,6 +64,12 @@ class SACAgent(BaseAgent):
         self._target_entropy = -action_size(self._actor._ac_space)
 
         self._actor_optim = optim.Adam(self._actor.parameters(), lr=config.lr_actor)
+        # the critic forward runs under autocast, float16 also needs loss scaling
+        self._amp_dtype = getattr(torch, config.amp_dtype)
+        self._use_amp = config.amp_dtype != "float32"
+        self._grad_scaler = torch.amp.GradScaler(
+            "cuda", enabled=config.amp_dtype == "float16"
+        )
         self._critic1_optim = optim.Adam(
             self._critic1.parameters(), lr=config.lr_critic
         )
@@ -76,7 +82,10 @@ class SACAgent(BaseAgent):
         if config.mopa or config.expand_ac_space:
             buffer_keys.append("intra_steps")
         self._buffer = ReplayBuffer(
-            buffer_keys, config.buffer_size, sampler.sample_func
+            buffer_keys,
+            config.buffer_size,
+            sampler.sample_func,
+            quantize_ob=config.quantize_ob,
         )
 
         self._log_creation()
@@ -386,12 +395,14 @@ class SACAgent(BaseAgent):
     def sync_networks(self):
         if self._config.is_mpi:
             sync_networks(self._actor)
-            sync_networks(self._critic2)
+            sync_networks(self._critic1)
             sync_networks(self._critic2)
 
     def train(self):
-        for i in range(self._config.num_batches):
-            transitions = self._buffer.sample(self._config.batch_size)
+        batches = self._buffer.sample_batches(
+            self._config.batch_size, self._config.num_batches, self._to_device
+        )
+        for i, transitions in enumerate(batches):
             train_info = self._update_network(transitions, i)
             self._soft_update_target_network(
                 self._critic1_target, self._critic1, self._config.polyak
@@ -472,8 +483,13 @@ class SACAgent(BaseAgent):
                     .float()
                     .squeeze(1)
                 )
-        real_q_value1 = self._critic1(o, ac)
-        real_q_value2 = self._critic2(o, ac)
+        with torch.autocast(
+            device_type="cuda", dtype=self._amp_dtype, enabled=self._use_amp
+        ):
+            real_q_value1 = self._critic1(o, ac)
+            real_q_value2 = self._critic2(o, ac)
+        real_q_value1 = real_q_value1.float()
+        real_q_value2 = real_q_value2.float()
         critic1_loss = 0.5 * (target_q_value - real_q_value1).pow(2).mean()
         critic2_loss = 0.5 * (target_q_value - real_q_value2).pow(2).mean()
 
@@ -495,16 +511,17 @@ class SACAgent(BaseAgent):
 
         # update the critic
         self._critic1_optim.zero_grad()
-        critic1_loss.backward()
+        self._grad_scaler.scale(critic1_loss).backward()
         if self._config.is_mpi:
             sync_grads(self._critic1)
-        self._critic1_optim.step()
+        self._grad_scaler.step(self._critic1_optim)
 
         self._critic2_optim.zero_grad()
-        critic2_loss.backward()
+        self._grad_scaler.scale(critic2_loss).backward()
         if self._config.is_mpi:
-            sync_grads(self, _critic2)
-        self._critic2_optim.step()
+            sync_grads(self._critic2)
+        self._grad_scaler.step(self._critic2_optim)
+        self._grad_scaler.update()
 
         if self._config.is_mpi:
             return mpi_average(info)
@@ -88,7 +88,10 @@ class TD3Agent(BaseAgent):
         if config.mopa or config.expand_ac_space:
             buffer_keys.append("intra_steps")
         self._buffer = ReplayBuffer(
-            buffer_keys, config.buffer_size, sampler.sample_func
+            buffer_keys,
+            config.buffer_size,
+            sampler.sample_func,
+            quantize_ob=config.quantize_ob,
         )
 
         self._log_creation()
@@ -379,8 +382,10 @@ class TD3Agent(BaseAgent):
 
     def train(self):
         config = self._config
-        for i in range(config.num_batches):
-            transitions = self._buffer.sample(config.batch_size)
+        batches = self._buffer.sample_batches(
+            config.batch_size, config.num_batches, self._to_device
+        )
+        for i, transitions in enumerate(batches):
             train_info = self._update_network(transitions, step=i)
             if self._update_steps % self._config.actor_update_freq:
                 self._soft_update_target_network(
@@ -397,6 +402,7 @@ class TD3Agent(BaseAgent):
     def act_log(self, ob, meta_ac=None):
         return self._actor.act_log(ob)
 
+    @torch.inference_mode()
     def act(self, ob, is_train=True, return_stds=False):
         ob = to_tensor(ob, self._config.device)
         if return_stds:
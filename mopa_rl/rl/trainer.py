@@ -1,17 +1,24 @@
 import os
-from time import time
+from time import time, perf_counter_ns
 from collections import defaultdict
 import gzip
+import tempfile
 import cv2
 import pickle
 import h5py
 import copy
+import itertools
+from functools import lru_cache
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import torch
+import torchvision
 from tqdm import tqdm
 import wandb
 import numpy as np
-import moviepy.editor as mpy
+import imageio
 from tqdm import tqdm, trange
 import env
 import gym
@@ -21,13 +28,22 @@ import matplotlib.pyplot as plt
 from collections import OrderedDict
 
 from mopa_rl.rl.policies import get_actor_critic_by_name
+from mopa_rl.rl.dataset import write_replay_h5, read_replay_h5
 from mopa_rl.rl.rollouts import RolloutRunner
 from mopa_rl.rl.mopa_rollouts import MoPARolloutRunner
 from mopa_rl.util.logger import logger
-from mopa_rl.util.pytorch import get_ckpt_path, count_parameters, to_tensor
+from mopa_rl.util.pytorch import (
+    get_ckpt_path,
+    count_parameters,
+    to_tensor,
+    save_safetensors_ckpt,
+    load_safetensors_ckpt,
+    compile_network,
+)
 from mopa_rl.util.mpi import mpi_sum
 from mopa_rl.util.gym import observation_size, action_size
 from mopa_rl.util.misc import make_ordered_pair
+from mopa_rl.util.info import RingInfo
 
 ###################### CODE TO SET UP ROBOSUITE ENVIRONMENT #################################
 import robosuite as suite 
@@ -305,6 +321,8 @@ def make_mopa_environment():
 
 #############################################################################################
 
+# the agent modules are imported on first use and only once per process
+@lru_cache(maxsize=None)
 def get_agent_by_name(algo):
     if algo == "sac":
         from rl.sac_agent import SACAgent
@@ -318,23 +336,40 @@ def get_agent_by_name(algo):
         raise NotImplementedError
 
 
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
 class Trainer(object):
     def __init__(self, config):
         self._config = config
         self._is_chef = config.is_chef
 
+        # planners share one MjSim across runner copies and offscreen
+        # rendering is not thread-safe, so neither can run concurrently
+        assert not config.parallel_eval or not (
+            config.mopa or config.record
+        ), "parallel_eval cannot be used with mopa or record"
+
         # create a new environment
         if config.env != "Lift":
             if config.env != "LiftMoPA":
                 self._env = gym.make(config.env, **config.__dict__)
-                self._env_eval = (
-                    gym.make(config.env, **copy.copy(config).__dict__)
+                # the eval env is built later, after config has been updated
+                # below, so it gets a snapshot of the kwargs the train env got
+                env_kwargs = dict(vars(config))
+                make_env_eval = (
+                    (lambda: gym.make(config.env, **env_kwargs))
                     if self._is_chef
-                    else None
+                    else (lambda: None)
                 )
             else:
                 self._env = make_mopa_environment()
-                self._env_eval = make_mopa_environment()
+                make_env_eval = make_mopa_environment
                 config.xml_path="/home/tarunc/Desktop/research/mopa-rl-1/rl/lift_env.xml"
             self._config._xml_path = self._env.xml_path
             ob_space = self._env.observation_space
@@ -342,7 +377,7 @@ class Trainer(object):
             joint_space = self._env.joint_space 
         else:
             self._env = make_standard_environment()
-            self._env_eval = make_standard_environment()
+            make_env_eval = make_standard_environment
             self._config._xml_path = None 
             # set various attributes to None 
             self._env.ref_joint_pos_indexes = None
@@ -356,19 +391,20 @@ class Trainer(object):
 
         config.nq = self._env.sim.model.nq
 
-        allowed_collsion_pairs = []
-        ignored_contact_geom_ids = []
         passive_joint_idx = list(range(len(self._env.sim.data.qpos)))
         if config.env != "Lift":
-            for manipulation_geom_id in self._env.manipulation_geom_ids:
-                for geom_id in self._env.static_geom_ids:
-                    allowed_collsion_pairs.append(
-                        make_ordered_pair(manipulation_geom_id, geom_id)
-                    )
+            allowed_collsion_pairs = [
+                make_ordered_pair(manipulation_geom_id, geom_id)
+                for manipulation_geom_id, geom_id in itertools.product(
+                    self._env.manipulation_geom_ids, self._env.static_geom_ids
+                )
+            ]
 
-            ignored_contact_geom_ids.extend(allowed_collsion_pairs)
-            config.ignored_contact_geom_ids = ignored_contact_geom_ids
-            [passive_joint_idx.remove(idx) for idx in self._env.ref_joint_pos_indexes]
+            config.ignored_contact_geom_ids = list(allowed_collsion_pairs)
+            active_joint_idx = set(self._env.ref_joint_pos_indexes)
+            passive_joint_idx = [
+                idx for idx in passive_joint_idx if idx not in active_joint_idx
+            ]
         config.passive_joint_idx = passive_joint_idx
 
         # get actor and critic networks
@@ -431,6 +467,10 @@ class Trainer(object):
                     ]
                 )
 
+        if config.amp_dtype != "float32" and config.device.type != "cuda":
+            logger.warn("Autocast of %s needs cuda, use float32", config.amp_dtype)
+            config.amp_dtype = "float32"
+
         ac_space.seed(config.seed)
         self._agent = get_agent_by_name(config.algo)(
             config,
@@ -447,17 +487,49 @@ class Trainer(object):
 
         self._agent._ac_space.seed(config.seed)
 
+        # rollouts act with their own copy of the actor so that collection can
+        # overlap with updates of the learner's networks
+        self._rollout_agent = self._agent
+        if config.async_rollout:
+            self._rollout_agent = copy.copy(self._agent)
+            self._rollout_agent._actor = copy.deepcopy(self._agent._actor)
+
+        if config.allow_tf32:
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+
+        if config.use_torch_compile:
+            for name in [
+                "_actor",
+                "_actor_target",
+                "_critic1",
+                "_critic2",
+                "_critic1_target",
+                "_critic2_target",
+            ]:
+                if hasattr(self._agent, name):
+                    compile_network(
+                        getattr(self._agent, name), mode=config.torch_compile_mode
+                    )
+            if self._rollout_agent is not self._agent:
+                compile_network(
+                    self._rollout_agent._actor, mode=config.torch_compile_mode
+                )
+
         self._runner = None
         if config.mopa:
             self._runner = MoPARolloutRunner(
-                config, self._env, self._env_eval, self._agent
+                config, self._env, make_env_eval, self._rollout_agent
             )
         else:
-            self._runner = RolloutRunner(config, self._env, self._env_eval, self._agent)
+            self._runner = RolloutRunner(
+                config, self._env, make_env_eval, self._rollout_agent
+            )
 
         # setup wandb
+        self._wandb_queue = None
         if self._is_chef and self._config.is_train and self._config.wandb:
-            exclude = ["device"]
+            exclude = frozenset(("device",))
             if config.debug:
                 os.environ["WANDB_MODE"] = "dryrun"
 
@@ -476,66 +548,119 @@ class Trainer(object):
                 tags=tags,
                 group=config.group,
             )
+            self._start_wandb_worker()
+
+    def _start_wandb_worker(self):
+        """
+        Hands wandb.log calls to a daemon thread so training does not wait on
+        wandb; a single worker keeps the logged steps in order.
+        """
+        self._wandb_queue = queue.Queue()
+
+        def drain():
+            while True:
+                payload, step, tmp_paths = self._wandb_queue.get()
+                try:
+                    wandb.log(payload, step=step)
+                except Exception:
+                    logger.exception("Failed to log to wandb at step %s", step)
+                finally:
+                    _remove_files(tmp_paths)
+                    self._wandb_queue.task_done()
+
+        threading.Thread(target=drain, daemon=True).start()
+
+    def _wandb_log(self, payload, step=None, tmp_paths=()):
+        """
+        Logs @payload to wandb and then deletes @tmp_paths, the files backing
+        its media; wandb copies them into the run directory on wandb.log.
+        """
+        if self._wandb_queue is None:
+            try:
+                wandb.log(payload, step=step)
+            finally:
+                _remove_files(tmp_paths)
+        else:
+            self._wandb_queue.put((payload, step, tmp_paths))
 
     def _save_ckpt(self, ckpt_num, update_iter, env_step):
-        ckpt_path = os.path.join(self._config.log_dir, "ckpt_%08d.pt" % ckpt_num)
+        ckpt_path = os.path.join(
+            self._config.log_dir, "ckpt_%08d.safetensors" % ckpt_num
+        )
         state_dict = {
-            "step": ckpt_num,
-            "update_iter": update_iter,
-            "env_step": env_step,
+            "step": int(ckpt_num),
+            "update_iter": int(update_iter),
+            "env_step": None if env_step is None else int(env_step),
         }
         state_dict["agent"] = self._agent.state_dict()
-        torch.save(state_dict, ckpt_path)
+        save_safetensors_ckpt(state_dict, ckpt_path)
         logger.warn("Save checkpoint: %s", ckpt_path)
 
-        replay_path = os.path.join(self._config.log_dir, "replay_%08d.pkl" % ckpt_num)
-        with gzip.open(replay_path, "wb") as f:
-            replay_buffers = {"replay": self._agent.replay_buffer()}
-            pickle.dump(replay_buffers, f)
+        replay_path = os.path.join(self._config.log_dir, "replay_%08d.h5" % ckpt_num)
+        replay_buffer = self._agent.replay_buffer()
+        with h5py.File(replay_path, "w", track_order=True) as hf:
+            write_replay_h5(hf, replay_buffer)
 
     def _load_ckpt(self, ckpt_num=None):
         ckpt_path, ckpt_num = get_ckpt_path(self._config.log_dir, ckpt_num)
 
         if ckpt_path is not None:
             logger.warn("Load checkpoint %s", ckpt_path)
-            ckpt = torch.load(ckpt_path)
+            if ckpt_path.endswith(".safetensors"):
+                ckpt = load_safetensors_ckpt(ckpt_path)
+            else:
+                ckpt = torch.load(ckpt_path)
             self._agent.load_state_dict(ckpt["agent"])
+            self._sync_rollout_actor()
 
             if self._config.is_train:
                 replay_path = os.path.join(
-                    self._config.log_dir, "replay_%08d.pkl" % ckpt_num
+                    self._config.log_dir, "replay_%08d.h5" % ckpt_num
                 )
-                logger.warn("Load replay_buffer %s", replay_path)
-                with gzip.open(replay_path, "rb") as f:
-                    replay_buffers = pickle.load(f)
-                    self._agent.load_replay_buffer(replay_buffers["replay"])
+                if os.path.exists(replay_path):
+                    logger.warn("Load replay_buffer %s", replay_path)
+                    with h5py.File(replay_path, "r") as hf:
+                        self._agent.load_replay_buffer(read_replay_h5(hf))
+                else:
+                    # replay buffers saved by older versions
+                    replay_path = os.path.join(
+                        self._config.log_dir, "replay_%08d.pkl" % ckpt_num
+                    )
+                    logger.warn("Load replay_buffer %s", replay_path)
+                    with gzip.open(replay_path, "rb") as f:
+                        replay_buffers = pickle.load(f)
+                        self._agent.load_replay_buffer(replay_buffers["replay"])
 
             return ckpt["step"], ckpt["update_iter"], ckpt["env_step"]
         else:
             logger.warn("Randomly initialize models")
             return 0, 0, 0
 
+    def _sync_rollout_actor(self):
+        if self._rollout_agent is not self._agent:
+            self._rollout_agent._actor.load_state_dict(self._agent._actor.state_dict())
+
     def _log_train(self, step, train_info, ep_info, prefix="", env_step=None):
         if env_step is None:
             env_step = step
+        payload = {}
         if (step // self._config.num_workers) % self._config.log_interval == 0:
             for k, v in train_info.items():
                 if np.isscalar(v) or (hasattr(v, "shape") and np.prod(v.shape) == 1):
-                    wandb.log({"train_rl/%s" % k: v}, step=step)
+                    payload["train_rl/%s" % k] = v
                 elif isinstance(v, np.ndarray) or isinstance(v, list):
-                    wandb.log({"train_rl/%s" % k: wandb.Histogram(v)}, step=step)
+                    payload["train_rl/%s" % k] = wandb.Histogram(v)
                 else:
-                    wandb.log({"train_rl/%s" % k: [wandb.Image(v)]}, step=step)
+                    payload["train_rl/%s" % k] = [wandb.Image(v)]
 
         for k, v in ep_info.items():
-            wandb.log(
-                {prefix + "train_ep/%s" % k: np.mean(v), "global_step": env_step},
-                step=step,
-            )
-            wandb.log(
-                {prefix + "train_ep_max/%s" % k: np.max(v), "global_step": env_step},
-                step=step,
-            )
+            payload[prefix + "train_ep/%s" % k] = np.mean(v)
+            payload[prefix + "train_ep_max/%s" % k] = np.max(v)
+        if ep_info:
+            payload["global_step"] = env_step
+        if payload:
+            self._wandb_log(payload, step=step)
+
         if self._config.vis_replay:
             if step % self._config.vis_replay_interval == 0:
                 self._vis_replay_buffer(step)
@@ -544,14 +669,26 @@ class Trainer(object):
         if env_step is None:
             env_step = step
         if self._config.is_train:
-            for k, v in ep_info.items():
-                wandb.log(
-                    {"test_ep/%s" % k: np.mean(v), "global_step": env_step}, step=step
-                )
+            payload = {"test_ep/%s" % k: np.mean(v) for k, v in ep_info.items()}
+            if ep_info:
+                payload["global_step"] = env_step
+            tmp_paths = []
             if vids is not None:
-                self.log_videos(
-                    vids.transpose((0, 1, 4, 2, 3)), "test_ep/video", step=step
-                )
+                if self._config.nvenc_video and self._config.device.type == "cuda":
+                    video_payload, tmp_paths = self._nvenc_video_log_dict(
+                        vids, "test_ep/video"
+                    )
+                    payload.update(video_payload)
+                else:
+                    payload.update(
+                        self._video_log_dict(
+                            vids.transpose((0, 1, 4, 2, 3)), "test_ep/video"
+                        )
+                    )
+            if payload:
+                self._wandb_log(payload, step=step, tmp_paths=tmp_paths)
+            else:
+                _remove_files(tmp_paths)
 
     def train(self):
         config = self._config
@@ -562,13 +699,14 @@ class Trainer(object):
 
         # sync the networks across the cpus
         self._agent.sync_networks()
+        self._sync_rollout_actor()
 
         logger.info("Start training at step=%d", step)
         if self._is_chef:
             pbar = tqdm(
                 initial=step, total=config.max_global_step, desc=config.run_name
             )
-            ep_info = defaultdict(list)
+            ep_info = RingInfo(config.log_interval)
 
         # dummy run for preventing weird
         runner = None
@@ -579,7 +717,7 @@ class Trainer(object):
         else:
             raise NotImplementedError
 
-        st_time = time()
+        st_time = perf_counter_ns()
         st_step = step
         global_run_ep = 0
 
@@ -597,10 +735,16 @@ class Trainer(object):
                     init_step += step_per_batch
                     self._agent.store_episode(rollout)
 
+        executor = ThreadPoolExecutor(max_workers=1) if config.async_rollout else None
+        train_future = None
+        train_info = {}
         while step < config.max_global_step:
             # collect rollouts
             env_step_per_batch = None
             rollout, info = next(runner)
+            if train_future is not None:
+                # wait for the update that ran while this rollout was collected
+                train_info = train_future.result()
             self._agent.store_episode(rollout)
 
             if config.is_mpi:
@@ -614,7 +758,12 @@ class Trainer(object):
             # train an agent
             if step % config.log_interval == 0:
                 logger.info("Update networks %d", update_iter)
-            train_info = self._agent.train()
+            if executor is None:
+                train_info = self._agent.train()
+            else:
+                # the next rollout acts with the weights from this update's start
+                self._sync_rollout_actor()
+                train_future = executor.submit(self._agent.train)
 
             if step % config.log_interval == 0:
                 logger.info("Update networks done")
@@ -633,23 +782,22 @@ class Trainer(object):
                     ("env_step" in info.keys() and len(info) > 1)
                     or ("env_step" not in info.keys() and len(info) != 0)
                 ):
-                    for k, v in info.items():
-                        if isinstance(v, list):
-                            ep_info[k].extend(v)
-                        else:
-                            ep_info[k].append(v)
+                    ep_info.add(info)
+                    # read the clock once so both rates share the same interval
+                    now = perf_counter_ns()
+                    elapsed = (now - st_time) / 1e9
                     train_info.update(
                         {
-                            "sec": (time() - st_time) / config.log_interval,
-                            "steps_per_sec": (step - st_step) / (time() - st_time),
+                            "sec": elapsed / config.log_interval,
+                            "steps_per_sec": (step - st_step) / elapsed,
                             "update_iter": update_iter,
                         }
                     )
-                    st_time = time()
+                    st_time = now
                     st_step = step
                     if self._config.wandb:
                         self._log_train(step, train_info, ep_info, env_step=env_step)
-                    ep_info = defaultdict(list)
+                    ep_info.clear()
 
                 ## Evaluate both MP and RL
                 if update_iter % config.evaluate_interval == 0:
@@ -663,20 +811,73 @@ class Trainer(object):
                         self._log_test(step, info, vids, obs, env_step=env_step)
 
                 if update_iter % config.ckpt_interval == 0:
+                    if train_future is not None:
+                        train_future.result()
                     self._save_ckpt(step, update_iter, env_step)
 
+        if train_future is not None:
+            # the last update is still running; wait for it so that its errors
+            # are raised and its metrics are logged
+            train_info = train_future.result()
+            if self._is_chef and self._config.wandb:
+                self._log_train(step, train_info, ep_info, env_step=env_step)
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if self._wandb_queue is not None:
+            self._wandb_queue.join()
         logger.info("Reached %s steps. worker %d stopped.", step, config.rank)
 
-    def _evaluate(self, step=None, record=False, idx=None):
-        """Run one rollout if in eval mode
-        Run num_record_samples rollouts if in train mode
+    def _eval_episodes(self, num_episodes, record):
+        """
+        Yields (rollout, info, frames) of @num_episodes evaluation episodes
+        in order. With parallel_eval, the episodes run on at most
+        num_eval_workers threads, each holding a runner with its own eval env.
         """
+        num_workers = min(num_episodes, self._config.num_eval_workers)
+        if num_workers <= 1 or not self._config.parallel_eval:
+            for _ in range(num_episodes):
+                yield self._runner.run_episode(is_train=False, record=record)
+            return
+
+        # the extra runners build their eval env on first use
+        extra_runners = []
+        for _ in range(num_workers - 1):
+            runner = copy.copy(self._runner)
+            runner._env_eval_instance = None
+            extra_runners.append(runner)
+        free_runners = queue.Queue()
+        for runner in [self._runner] + extra_runners:
+            free_runners.put(runner)
+
+        def run_episode():
+            runner = free_runners.get()
+            try:
+                return runner.run_episode(is_train=False, record=record)
+            finally:
+                free_runners.put(runner)
+
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(run_episode) for _ in range(num_episodes)]
+                for future in futures:
+                    yield future.result()
+        finally:
+            # only the main runner keeps its eval env between evaluations
+            for runner in extra_runners:
+                if runner._env_eval_instance is not None:
+                    runner._env_eval_instance.close()
+                    runner._env_eval_instance = None
+
+    def _evaluate(self, step=None, record=False):
+        """Run num_record_samples rollouts if in train mode"""
+        num_episodes = self._config.num_record_samples
+        episodes = tqdm(self._eval_episodes(num_episodes, record), total=num_episodes)
+        return self._summarize_eval(episodes, step=step, record=record)
+
+    def _summarize_eval(self, episodes, step=None, record=False, idx=None):
         vids = []
         avg_info = defaultdict(list)
-        for i in tqdm(range(self._config.num_record_samples)):
-            rollout, info, frames = self._runner.run_episode(
-                is_train=False, record=record
-            )
+        for i, (rollout, info, frames) in enumerate(episodes):
             for k in info.keys():
                 avg_info[k].append(info[k])
             if record and i == 0:
@@ -692,9 +893,6 @@ class Trainer(object):
                 self._save_video(fname, frames)
                 vids.append(frames)
 
-            if idx is not None:
-                break
-
         logger.info("rollout: %s", {k: v for k, v in info.items() if not "qpos" in k})
         info = {k:np.mean(avg_info[k]) for k in avg_info.keys() if k != 'rew'}
         return rollout, info, np.array(vids)
@@ -708,27 +906,38 @@ class Trainer(object):
             step,
             update_iter,
         )
-        info_history = defaultdict(list)
         rollouts = []
-        for i in trange(self._config.num_eval):
-            logger.warn("Evalute run %d", i + 1)
-            rollout, info, vids = self._evaluate(
-                step=step, record=self._config.record, idx=i
-            )
-            for k, v in info.items():
-                info_history[k].append(v)
-            if self._config.save_rollout:
-                rollouts.append(rollout)
-
         keys = ["episode_success", "reward_goal_dist"]
         os.makedirs("result", exist_ok=True)
         with h5py.File("result/{}.hdf5".format(self._config.run_name), "w") as hf:
-            for k in keys:
-                hf.create_dataset(k, data=info_history[k])
-
+            # results are appended as each evaluation finishes
+            datasets = {
+                k: hf.create_dataset(
+                    k,
+                    shape=(0,),
+                    maxshape=(None,),
+                    dtype="f8",
+                    chunks=(1024,),
+                    compression="lzf",
+                )
+                for k in keys
+            }
+            episodes = self._eval_episodes(self._config.num_eval, self._config.record)
+            for i, episode in enumerate(tqdm(episodes, total=self._config.num_eval)):
+                logger.warn("Evalute run %d", i + 1)
+                rollout, info, vids = self._summarize_eval(
+                    [episode], step=step, record=self._config.record, idx=i
+                )
+                for k, ds in datasets.items():
+                    if k in info:
+                        ds.resize((ds.shape[0] + 1,))
+                        ds[-1] = info[k]
+                if self._config.save_rollout:
+                    rollouts.append(rollout)
+
+            episode_success = datasets["episode_success"][()]
             result = "{:.02f} $\\pm$ {:.02f}".format(
-                np.mean(info_history["episode_success"]),
-                np.std(info_history["episode_success"]),
+                np.mean(episode_success), np.std(episode_success)
             )
             logger.warn(result)
 
@@ -740,15 +949,19 @@ class Trainer(object):
     def _save_video(self, fname, frames, fps=8.0):
         path = os.path.join(self._config.record_dir, fname)
 
-        def f(t):
-            frame_length = len(frames)
-            new_fps = 1.0 / (1.0 / fps + 1.0 / frame_length)
-            idx = min(int(t * new_fps), frame_length - 1)
-            return frames[idx]
-
-        video = mpy.VideoClip(f, duration=len(frames) / fps + 2)
-
-        video.write_videofile(path, fps, verbose=False, logger=None)
+        if self._config.nvenc_video and self._config.device.type == "cuda":
+            writer_kwargs = {"codec": "h264_nvenc"}
+        else:
+            writer_kwargs = {"codec": "libx264", "quality": 7}
+        with imageio.get_writer(
+            path, fps=fps, macro_block_size=1, **writer_kwargs
+        ) as writer:
+            for frame in frames:
+                writer.append_data(np.clip(frame, 0, 255).astype(np.uint8))
+            # hold the last frame for two seconds
+            last_frame = np.clip(frames[-1], 0, 255).astype(np.uint8)
+            for _ in range(int(2 * fps)):
+                writer.append_data(last_frame)
         logger.warn("[*] Video saved: {}".format(path))
 
     def _vis_replay_buffer(self, step):
@@ -758,9 +971,7 @@ class Trainer(object):
         size = self._agent._buffer._current_size
         fig = plt.figure()
         if self._config.plot_type == "2d":
-            states = np.array(
-                [ob[1]["fingertip"] for ob in self._agent._buffer.state_dict()["ob"]]
-            )
+            states = self._agent._buffer.column("ob_next", "fingertip")
             plt.scatter(
                 states[:, 0],
                 states[:, 1],
@@ -769,12 +980,10 @@ class Trainer(object):
                 cmap="Blues",
             )
             plt.axis("equal")
-            wandb.log({"replay_vis": wandb.Image(fig)}, step=step)
+            self._wandb_log({"replay_vis": wandb.Image(fig)}, step=step)
             plt.close(fig)
         else:
-            states = np.array(
-                [ob[1]["eef_pos"] for ob in self._agent._buffer.state_dict()["ob"]]
-            )
+            states = self._agent._buffer.column("ob_next", "eef_pos")
             ax = fig.add_subplot(111, projection="3d")
             ax.scatter(
                 states[:, 0],
@@ -806,13 +1015,40 @@ class Trainer(object):
                 ax.set_zlim3d([z_middle - plot_radius, z_middle + plot_radius])
 
             set_axes_equal(ax)
-            wandb.log({"replay_vis": wandb.Image(ax)}, step=step)
+            self._wandb_log({"replay_vis": wandb.Image(ax)}, step=step)
             plt.close(fig)
 
+    def _video_log_dict(self, vids, name, fps=15):
+        assert len(vids[0].shape) == 4 and vids[0].shape[1] == 3
+        assert isinstance(vids[0], np.ndarray)
+        return {name: [wandb.Video(vid, fps=fps, format="mp4") for vid in vids]}
+
+    def _nvenc_video_log_dict(self, vids, name, fps=15):
+        """
+        Encodes [video, time, height, width, channels] @vids with NVENC into
+        temporary files and logs those instead of letting wandb.Video encode
+        the arrays with libx264 on the cpu. Returns the payload and the
+        temporary paths, which the caller removes once the payload is logged.
+        """
+        # write_video takes host frames, the encoder does its own upload
+        frames = np.clip(np.asarray(vids), 0, 255).astype(np.uint8)
+        videos = []
+        paths = []
+        try:
+            for vid in frames:
+                fd, path = tempfile.mkstemp(suffix=".mp4")
+                os.close(fd)
+                paths.append(path)
+                torchvision.io.write_video(
+                    path, torch.from_numpy(vid), fps=fps, video_codec="h264_nvenc"
+                )
+                videos.append(wandb.Video(path, format="mp4"))
+        except Exception:
+            _remove_files(paths)
+            raise
+        return {name: videos}, paths
+
     def log_videos(self, vids, name, fps=15, step=None):
         """Logs videos to WandB in mp4 format.
         Assumes list of numpy arrays as input with [time, channels, height, width]."""
-        assert len(vids[0].shape) == 4 and vids[0].shape[1] == 3
-        assert isinstance(vids[0], np.ndarray)
-        log_dict = {name: [wandb.Video(vid, fps=fps, format="mp4") for vid in vids]}
-        wandb.log(log_dict) if step is None else wandb.log(log_dict, step=step)
+        self._wandb_log(self._video_log_dict(vids, name, fps=fps), step=step)
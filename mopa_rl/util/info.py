@@ -50,3 +50,37 @@ class Info(object):
 
     def items(self):
         return self._info.items()
+
+
+class RingInfo(object):
+    """
+    Keeps the last @size scalar values of every key in preallocated arrays,
+    so that aggregating them is a reduction over a contiguous slice. Values
+    are stored as float64, which keeps step counters exact.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._buffers = {}
+        self._counts = {}
+
+    def add(self, info):
+        for k, v in info.items():
+            if k not in self._buffers:
+                self._buffers[k] = np.empty(self._size, dtype=np.float64)
+                self._counts[k] = 0
+            for x in v if isinstance(v, list) else [v]:
+                self._buffers[k][self._counts[k] % self._size] = x
+                self._counts[k] += 1
+
+    def clear(self):
+        for k in self._counts:
+            self._counts[k] = 0
+
+    def items(self):
+        for k, n in self._counts.items():
+            if n > 0:
+                yield k, self._buffers[k][: min(n, self._size)]
+
+    def __len__(self):
+        return sum(n > 0 for n in self._counts.values())
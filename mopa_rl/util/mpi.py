@@ -1,11 +1,40 @@
+import os
+
 import numpy as np
+import torch
+import torch.distributed as dist
 from mpi4py import MPI
 
 
+# gloo group used to reduce host-side values when the default group is nccl
+_cpu_group = None
+
+
+def init_distributed():
+    """
+    Initializes torch.distributed from the environment set by torchrun and
+    returns (rank, world_size, local_rank).
+
+    Networks are synced with nccl when cuda is available, so they have to
+    live on the local gpu in that case, and on the cpu with gloo otherwise.
+    """
+    global _cpu_group
+    backend = "nccl" if torch.cuda.is_available() else "gloo"
+    dist.init_process_group(backend=backend)
+    if backend == "nccl":
+        _cpu_group = dist.new_group(backend="gloo")
+    return dist.get_rank(), dist.get_world_size(), int(os.environ["LOCAL_RANK"])
+
+
+def _world_size():
+    if dist.is_initialized():
+        return dist.get_world_size()
+    return MPI.COMM_WORLD.Get_size()
+
+
 def _mpi_average(x):
-    buf = np.zeros_like(x)
-    MPI.COMM_WORLD.Allreduce(x, buf, op=MPI.SUM)
-    buf /= MPI.COMM_WORLD.Get_size()
+    buf = _mpi_sum(x)
+    buf /= _world_size()
     return buf
 
 
@@ -19,6 +48,10 @@ def mpi_average(x):
 
 
 def _mpi_sum(x):
+    if dist.is_initialized():
+        buf = torch.from_numpy(np.array(x))
+        dist.all_reduce(buf, op=dist.ReduceOp.SUM, group=_cpu_group)
+        return buf.numpy()
     buf = np.zeros_like(x)
     MPI.COMM_WORLD.Allreduce(x, buf, op=MPI.SUM)
     return buf
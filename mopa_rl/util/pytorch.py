@@ -1,14 +1,17 @@
 import os
 import io
+import json
 from glob import glob
 from collections import OrderedDict
 
 import numpy as np
 import torch
 import torch.distributed as dist
+from torch.nn.utils import parameters_to_vector
 import torchvision.utils as vutils
 import torchvision.transforms.functional as TF
 import PIL.Image
+from safetensors.torch import save_file, load_file
 from mpi4py import MPI
 
 
@@ -25,29 +28,101 @@ def optimizer_cuda(optimizer, device):
                 state[k] = v.to(device)
 
 
+# checkpoint formats, in order of preference
+_CKPT_EXTENSIONS = (".safetensors", ".pt")
+
+
 def get_ckpt_path(base_dir, ckpt_num):
     if ckpt_num is None:
         return get_recent_ckpt_path(base_dir)
-    files = glob(os.path.join(base_dir, "*.pt"))
-    for f in files:
-        if "ckpt_%08d.pt" % ckpt_num in f:
-            return f, ckpt_num
-    raise Exception("Did not find ckpt_%s.pt" % ckpt_num)
+    for ext in _CKPT_EXTENSIONS:
+        files = glob(os.path.join(base_dir, "*" + ext))
+        for f in files:
+            if "ckpt_%08d%s" % (ckpt_num, ext) in f:
+                return f, ckpt_num
+    raise Exception("Did not find ckpt_%s" % ckpt_num)
 
 
 def get_recent_ckpt_path(base_dir):
-    files = glob(os.path.join(base_dir, "*.pt"))
+    files = []
+    for ext in _CKPT_EXTENSIONS:
+        files.extend(glob(os.path.join(base_dir, "*" + ext)))
     files.sort()
     if len(files) == 0:
         return None, None
     max_step = max([f.rsplit("_", 1)[-1].split(".")[0] for f in files])
     paths = [f for f in files if max_step in f]
+    if len(paths) > 1:
+        # a step saved in both formats is loaded from safetensors
+        paths = [f for f in paths if f.endswith(_CKPT_EXTENSIONS[0])] or paths
     if len(paths) == 1:
         return paths[0], int(max_step)
     else:
         raise Exception("Multiple most recent ckpts %s" % paths)
 
 
+def _flatten_state(state, tensors, prefix):
+    # copy every tensor so the checkpoint neither aliases live weights nor
+    # shares storage between entries, which save_file rejects
+    if isinstance(state, torch.Tensor):
+        tensors[prefix] = state.detach().cpu().clone(
+            memory_format=torch.contiguous_format
+        )
+        return {"tensor": prefix}
+    if isinstance(state, np.ndarray):
+        tensors[prefix] = torch.from_numpy(np.array(state, order="C"))
+        return {"ndarray": prefix}
+    if isinstance(state, dict):
+        return {
+            "dict": [
+                [k, _flatten_state(v, tensors, "%s.%s" % (prefix, k))]
+                for k, v in state.items()
+            ]
+        }
+    if isinstance(state, (list, tuple)):
+        return {
+            "list": [
+                _flatten_state(v, tensors, "%s.%d" % (prefix, i))
+                for i, v in enumerate(state)
+            ]
+        }
+    if isinstance(state, np.generic):
+        state = state.item()
+    return {"value": state}
+
+
+def _unflatten_state(skeleton, tensors):
+    if "tensor" in skeleton:
+        return tensors[skeleton["tensor"]]
+    if "ndarray" in skeleton:
+        return tensors[skeleton["ndarray"]].numpy()
+    if "dict" in skeleton:
+        return OrderedDict(
+            [(k, _unflatten_state(v, tensors)) for k, v in skeleton["dict"]]
+        )
+    if "list" in skeleton:
+        return [_unflatten_state(v, tensors) for v in skeleton["list"]]
+    return skeleton["value"]
+
+
+def save_safetensors_ckpt(state, path):
+    """
+    Saves every tensor and array of the nested @state with safetensors at
+    @path, and the rest of its structure in a JSON sidecar next to it.
+    """
+    tensors = {}
+    skeleton = _flatten_state(state, tensors, "state")
+    save_file(tensors, path)
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump(skeleton, f)
+
+
+def load_safetensors_ckpt(path):
+    with open(os.path.splitext(path)[0] + ".json", "r") as f:
+        skeleton = json.load(f)
+    return _unflatten_state(skeleton, load_file(path, device="cpu"))
+
+
 def image_grid(image, n=4):
     return vutils.make_grid(image[:n], nrow=n).cpu().detach().numpy()
 
@@ -56,6 +131,18 @@ def count_parameters(model):
     return sum(p.numel() for p in model.parameters() if p.requires_grad)
 
 
+def compile_network(network, mode="default"):
+    """
+    Compiles the forward of @network in place so that its attributes,
+    parameter names and state_dict keys stay the same as the eager module.
+    The "reduce-overhead" @mode captures CUDA graphs, whose outputs are
+    overwritten by the next call, so it is only safe for single-threaded
+    callers that use each output before calling again.
+    """
+    network.forward = torch.compile(network.forward, mode=mode)
+    return network
+
+
 def slice_tensor(input, indices):
     ret = {}
     for k, v in input.items():
@@ -104,10 +191,36 @@ def compute_weight_sum(model):
 
 
 # sync_networks across the different cores
+def _check_dist_device(tensor):
+    # nccl only reduces cuda tensors and gloo is used for host tensors
+    if tensor.is_cuda != (dist.get_backend() == dist.Backend.NCCL):
+        raise RuntimeError(
+            "torch.distributed backend %s cannot reduce tensors on %s"
+            % (dist.get_backend(), tensor.device)
+        )
+
+
 def sync_networks(network):
     """
     netowrk is the network you want to sync
     """
+    if dist.is_initialized():
+        # broadcast the flattened parameters on their own device
+        params = list(network.parameters())
+        if len(params) == 0:
+            return
+        flat_params = parameters_to_vector(params)
+        _check_dist_device(flat_params)
+        dist.broadcast(flat_params, src=0)
+        # copy back instead of vector_to_parameters, which would leave every
+        # parameter as a view into the flat buffer
+        pointer = 0
+        with torch.no_grad():
+            for p in params:
+                p.copy_(flat_params[pointer : pointer + p.numel()].view_as(p))
+                pointer += p.numel()
+        return
+
     comm = MPI.COMM_WORLD
     flat_params, params_shape = _get_flat_params(network)
     comm.Bcast(flat_params, root=0)
@@ -151,6 +264,26 @@ def _set_flat_params(network, params_shape, params):
 
 # sync gradients across the different cores
 def sync_grads(network):
+    if dist.is_initialized():
+        # all-reduce every gradient in one bucket without leaving the device;
+        # missing grads are zero-filled so all ranks reduce the same layout
+        params = list(network.parameters())
+        if len(params) == 0:
+            return
+        for p in params:
+            if p.grad is None:
+                p.grad = torch.zeros_like(p)
+        grads = [p.grad for p in params]
+        flat_grads = torch.cat([g.view(-1) for g in grads])
+        _check_dist_device(flat_grads)
+        dist.all_reduce(flat_grads, op=dist.ReduceOp.SUM)
+        flat_grads /= dist.get_world_size()
+        pointer = 0
+        for g in grads:
+            g.copy_(flat_grads[pointer : pointer + g.numel()].view_as(g))
+            pointer += g.numel()
+        return
+
     flat_grads, grads_shape = _get_flat_grads(network)
     comm = MPI.COMM_WORLD
     global_grads = np.zeros_like(flat_grads)
@@ -250,6 +383,55 @@ def to_tensor(x, device):
     return torch.as_tensor(x, dtype=torch.float32).to(device)
 
 
+def to_tensor_packed(x, device):
+    """
+    Same as to_tensor for a dict of arrays, but moves all values to @device
+    as one contiguous block, so a single observation costs one host to
+    device copy instead of one per key. Dicts that already hold tensors, as
+    passed by agents that convert the observation themselves, are handed to
+    to_tensor unchanged.
+    """
+    if any(isinstance(v, torch.Tensor) for v in x.values()):
+        return to_tensor(x, device)
+    arrays = [np.asarray(v, dtype=np.float32) for v in x.values()]
+    block = torch.from_numpy(np.concatenate([a.ravel() for a in arrays]))
+    block = block.to(device)
+    tensors = OrderedDict()
+    offset = 0
+    for k, a in zip(x.keys(), arrays):
+        tensors[k] = block[offset : offset + a.size].view(a.shape)
+        offset += a.size
+    return tensors
+
+
+def _pinned_copy(x, device, compute_stream):
+    if isinstance(x, dict):
+        return OrderedDict(
+            [(k, _pinned_copy(v, device, compute_stream)) for k, v in x.items()]
+        )
+    if x.dtype == object:
+        return x
+    tensor = torch.as_tensor(x, dtype=torch.float32).pin_memory()
+    tensor = tensor.to(device, non_blocking=True)
+    # allocated on the copy stream but consumed on the compute stream
+    tensor.record_stream(compute_stream)
+    return tensor
+
+
+# transfer numpy arrays to a cuda device without blocking the host
+def to_tensor_async(x, device, stream):
+    """
+    Copies the numpy arrays in @x to @device through pinned memory on
+    @stream, and makes the current stream wait for the copies. Values that
+    are not numeric arrays, such as None placeholders, are returned as is.
+    """
+    compute_stream = torch.cuda.current_stream(device)
+    with torch.cuda.stream(stream):
+        tensors = _pinned_copy(x, device, compute_stream)
+    compute_stream.wait_stream(stream)
+    return tensors
+
+
 def list2dict(rollout):
     ret = OrderedDict()
     for k in rollout[0].keys():
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the policies import their siblings as top-level packages, as when running
+# from inside mopa_rl
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "mopa_rl"))
@@ -0,0 +1,60 @@
+from argparse import Namespace
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+import torch
+from gym import spaces
+
+from rl.policies.mlp_actor_critic import MlpActor
+
+
+def make_actor():
+    config = Namespace(
+        rl_activation="relu",
+        rl_hid_size=8,
+        actor_num_hid_layers=1,
+        device=torch.device("cpu"),
+        algo="sac",
+    )
+    ob_space = spaces.Dict(
+        [
+            ("default", spaces.Box(-1.0, 1.0, shape=(3,))),
+            ("gripper", spaces.Box(-1.0, 1.0, shape=(1,))),
+        ]
+    )
+    ac_space = spaces.Dict([("default", spaces.Box(-1.0, 1.0, shape=(2,)))])
+    return MlpActor(config, ob_space, ac_space, tanh_policy=True)
+
+
+def make_ob():
+    return OrderedDict(
+        [("default", np.array([0.1, -0.2, 0.3])), ("gripper", np.array([0.5]))]
+    )
+
+
+@pytest.mark.parametrize("as_tensor", [False, True])
+def test_act_accepts_arrays_and_tensors(as_tensor):
+    actor = make_actor()
+    ob = make_ob()
+    if as_tensor:
+        ob = OrderedDict(
+            [(k, torch.as_tensor(v, dtype=torch.float32)) for k, v in ob.items()]
+        )
+
+    ac, activation = actor.act(ob, is_train=False)
+
+    assert ac["default"].shape == (2,)
+    assert np.all(np.abs(ac["default"]) <= 1.0)
+
+
+def test_act_matches_for_arrays_and_tensors():
+    actor = make_actor()
+    ob = make_ob()
+    tensor_ob = OrderedDict(
+        [(k, torch.as_tensor(v, dtype=torch.float32)) for k, v in ob.items()]
+    )
+
+    ac, _ = actor.act(ob, is_train=False)
+    tensor_ac, _ = actor.act(tensor_ob, is_train=False)
+    np.testing.assert_allclose(ac["default"], tensor_ac["default"], rtol=1e-6)
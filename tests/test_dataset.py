@@ -0,0 +1,179 @@
+from collections import OrderedDict
+
+import h5py
+import numpy as np
+import pytest
+
+from mopa_rl.rl.dataset import (
+    RandomSampler,
+    ReplayBuffer,
+    read_replay_h5,
+    write_replay_h5,
+)
+
+
+KEYS = ["ob", "ac", "meta_ac", "done", "rew", "intra_steps"]
+
+
+def make_rollout(start, length, ob_scale=1.0):
+    obs = [
+        OrderedDict(
+            [
+                ("default", np.full(3, (start + t) * ob_scale)),
+                ("gripper", np.array([-(start + t) * ob_scale])),
+            ]
+        )
+        for t in range(length + 1)
+    ]
+    return {
+        "ob": obs,
+        "ac": [
+            OrderedDict(
+                [("default", np.full(2, start + t, dtype=np.float32)), ("ac_type", 1)]
+            )
+            for t in range(length)
+        ],
+        "meta_ac": [None] * length,
+        "done": [t == length - 1 for t in range(length)],
+        # the first reward of an episode is often an integer 0
+        "rew": [start + t if t == 0 else float(start + t) for t in range(length)],
+        "intra_steps": [start + t for t in range(length)],
+    }
+
+
+def make_buffer(size=8, quantize_ob=False):
+    return ReplayBuffer(KEYS, size, RandomSampler().sample_func, quantize_ob)
+
+
+def test_store_wraps_around():
+    buffer = make_buffer(size=3)
+    buffer.store_episode(make_rollout(0, 5))
+
+    assert buffer._current_size == 3
+    assert buffer._idx == 2
+    np.testing.assert_array_equal(buffer._buffers["rew"], [3.0, 4.0, 2.0])
+    np.testing.assert_array_equal(
+        buffer._buffers["ob_next"]["default"][:, 0], [4.0, 5.0, 3.0]
+    )
+
+
+def test_keeps_integer_dtypes():
+    buffer = make_buffer()
+    buffer.store_episode(make_rollout(0, 2))
+
+    assert buffer._buffers["done"].dtype == np.bool_
+    assert buffer._buffers["intra_steps"].dtype.kind == "i"
+    assert buffer._buffers["rew"].dtype == np.float32
+    assert buffer._buffers["ac"]["default"].dtype == np.float32
+    assert buffer._buffers["ac"]["ac_type"].dtype.kind == "i"
+    assert buffer._buffers["meta_ac"].dtype == object
+
+
+def test_sample_batches():
+    buffer = make_buffer()
+    buffer.store_episode(make_rollout(0, 5))
+
+    batches = buffer.sample_batches(4, 3)
+    assert len(batches) == 3
+    for batch in batches:
+        assert batch["ob"]["default"].shape == (4, 3)
+        assert batch["ac"]["default"].shape == (4, 2)
+        # every sampled transition is one that was stored
+        np.testing.assert_array_equal(
+            batch["ob_next"]["default"][:, 0], batch["ob"]["default"][:, 0] + 1
+        )
+
+
+def test_quantize_round_trip():
+    buffer = make_buffer(quantize_ob=True)
+    rollout = make_rollout(0, 5, ob_scale=0.1)
+    buffer.store_episode(rollout)
+
+    assert buffer._buffers["ob"]["default"].dtype == np.uint8
+    ob = buffer.column("ob", "default")
+    scale = buffer._ob_scale["default"]
+    expected = np.stack([o["default"] for o in rollout["ob"][:-1]])
+    assert np.all(np.abs(ob - expected) <= scale / 2 + 1e-6)
+
+
+def test_expand_range_requantizes_stored_obs():
+    buffer = make_buffer(quantize_ob=True)
+    buffer.store_episode(make_rollout(0, 2, ob_scale=0.1))
+    old_scale = buffer._ob_scale["default"].copy()
+    buffer.store_episode(make_rollout(100, 2, ob_scale=0.1))
+
+    scale = buffer._ob_scale["default"]
+    assert np.all(scale > old_scale)
+    ob = buffer.column("ob", "default")[:, 0]
+    np.testing.assert_allclose(ob, [0.0, 0.1, 10.0, 10.1], atol=scale[0] / 2 + 1e-6)
+
+
+@pytest.mark.parametrize("quantize_ob", [False, True])
+def test_state_dict_round_trip(quantize_ob):
+    buffer = make_buffer(size=4, quantize_ob=quantize_ob)
+    buffer.store_episode(make_rollout(0, 6))
+
+    restored = make_buffer(size=4)
+    restored.load_state_dict(buffer.state_dict())
+
+    assert restored._quantize_ob == quantize_ob
+    assert restored._idx == buffer._idx
+    assert restored._current_size == buffer._current_size
+    for key in ["ob", "ob_next"]:
+        np.testing.assert_array_equal(
+            restored.column(key, "default"), buffer.column(key, "default")
+        )
+    np.testing.assert_array_equal(restored._buffers["rew"], buffer._buffers["rew"])
+
+
+def test_load_float_buffers_into_quantizing_buffer():
+    buffer = make_buffer(size=4)
+    buffer.store_episode(make_rollout(0, 3, ob_scale=0.1))
+
+    restored = make_buffer(size=4, quantize_ob=True)
+    restored.load_state_dict(buffer.state_dict())
+
+    assert restored._buffers["ob"]["default"].dtype == np.uint8
+    scale = restored._ob_scale["default"]
+    assert np.all(
+        np.abs(restored.column("ob", "default") - buffer.column("ob", "default"))
+        <= scale / 2 + 1e-6
+    )
+
+
+def test_load_legacy_state_dict():
+    # older buffers kept one list entry per stored rollout chunk
+    chunks = [make_rollout(0, 2), make_rollout(2, 1)]
+    legacy = {k: [chunk[k] for chunk in chunks] for k in KEYS}
+
+    buffer = make_buffer()
+    buffer.load_state_dict(legacy)
+
+    assert buffer._current_size == 3
+    np.testing.assert_array_equal(buffer._buffers["rew"][:3], [0.0, 1.0, 2.0])
+    np.testing.assert_array_equal(
+        buffer.column("ob_next", "default")[:, 0], [1.0, 2.0, 3.0]
+    )
+
+
+@pytest.mark.parametrize("quantize_ob", [False, True])
+def test_hdf5_round_trip(tmp_path, quantize_ob):
+    buffer = make_buffer(size=4, quantize_ob=quantize_ob)
+    buffer.store_episode(make_rollout(0, 5))
+    path = str(tmp_path / "replay.h5")
+
+    with h5py.File(path, "w", track_order=True) as hf:
+        write_replay_h5(hf, buffer.state_dict())
+    restored = make_buffer(size=4)
+    with h5py.File(path, "r") as hf:
+        restored.load_state_dict(read_replay_h5(hf))
+
+    assert restored._idx == buffer._idx
+    assert restored._current_size == buffer._current_size
+    assert list(restored._buffers["ob"].keys()) == ["default", "gripper"]
+    for key in ["ob", "ob_next"]:
+        np.testing.assert_array_equal(
+            restored.column(key, "gripper"), buffer.column(key, "gripper")
+        )
+    assert restored._buffers["done"].dtype == np.bool_
+    assert restored._buffers["meta_ac"][0] is None
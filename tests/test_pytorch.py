@@ -0,0 +1,83 @@
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+
+from mopa_rl.util.pytorch import (
+    get_recent_ckpt_path,
+    load_safetensors_ckpt,
+    save_safetensors_ckpt,
+)
+
+
+def make_state():
+    network = nn.Sequential(nn.Linear(3, 4), nn.ReLU(), nn.Linear(4, 2))
+    optimizer = torch.optim.Adam(network.parameters(), lr=1e-3)
+    network(torch.randn(5, 3)).sum().backward()
+    optimizer.step()
+    state = {
+        "step": 10,
+        "update_iter": 3,
+        "env_step": None,
+        "agent": {
+            "log_alpha": np.array([0.5], dtype=np.float32),
+            "actor_state_dict": network.state_dict(),
+            "actor_optim_state_dict": optimizer.state_dict(),
+        },
+    }
+    return network, optimizer, state
+
+
+def test_safetensors_ckpt_round_trip(tmp_path):
+    network, optimizer, state = make_state()
+    path = str(tmp_path / "ckpt_00000010.safetensors")
+    save_safetensors_ckpt(state, path)
+    ckpt = load_safetensors_ckpt(path)
+
+    assert ckpt["step"] == 10
+    assert ckpt["update_iter"] == 3
+    assert ckpt["env_step"] is None
+    np.testing.assert_array_equal(ckpt["agent"]["log_alpha"], [0.5])
+
+    restored = nn.Sequential(nn.Linear(3, 4), nn.ReLU(), nn.Linear(4, 2))
+    restored.load_state_dict(ckpt["agent"]["actor_state_dict"])
+    for p, q in zip(network.parameters(), restored.parameters()):
+        assert torch.equal(p, q)
+
+    restored_optim = torch.optim.Adam(restored.parameters(), lr=1e-3)
+    restored_optim.load_state_dict(ckpt["agent"]["actor_optim_state_dict"])
+    for k, v in optimizer.state_dict()["state"].items():
+        restored_v = restored_optim.state_dict()["state"][k]
+        assert torch.equal(v["exp_avg"], restored_v["exp_avg"])
+
+
+def test_safetensors_ckpt_copies_shared_storage(tmp_path):
+    network, _, state = make_state()
+    # leave every parameter as a view into one flat buffer
+    vector_to_parameters(
+        parameters_to_vector(network.parameters()).clone(), network.parameters()
+    )
+    state["agent"]["actor_state_dict"] = network.state_dict()
+    path = str(tmp_path / "ckpt_00000010.safetensors")
+    save_safetensors_ckpt(state, path)
+
+    ckpt = load_safetensors_ckpt(path)
+    weight = ckpt["agent"]["actor_state_dict"]["0.weight"]
+    assert torch.equal(weight, network[0].weight)
+    # the checkpoint does not alias the live weights
+    with torch.no_grad():
+        network[0].weight.zero_()
+    assert not torch.equal(weight, network[0].weight)
+
+
+def test_recent_ckpt_prefers_safetensors(tmp_path):
+    for name in [
+        "ckpt_00000005.pt",
+        "ckpt_00000010.pt",
+        "ckpt_00000010.safetensors",
+    ]:
+        (tmp_path / name).touch()
+
+    path, step = get_recent_ckpt_path(str(tmp_path))
+    assert step == 10
+    assert path.endswith("ckpt_00000010.safetensors")